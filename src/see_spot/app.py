@@ -6,6 +6,7 @@ from datetime import datetime
 from see_spot import ng_utils
 from see_spot import __version__
 import uvicorn
+import asyncio
 import logging
 import os
 from pathlib import Path
@@ -20,9 +21,10 @@ from see_spot.s3_handler import s3_handler
 from see_spot.logging_config import setup_logging
 from see_spot.s3_utils import (
     find_unmixed_spots_file, find_related_files,
-    load_ratios_from_s3, load_summary_stats_from_s3,
+    load_related_files_from_s3,
     load_processing_manifest_from_s3, load_and_merge_spots_from_s3,
-    find_processing_manifest, detect_tile_structure, extract_tile_suffix
+    find_processing_manifest, detect_tile_structure, extract_tile_suffix,
+    spots_to_pandas
 )
 
 
@@ -88,17 +90,22 @@ S3_BUCKET = os.getenv('SEESPOT_BUCKET') or config.get('aws', {}).get('bucket', '
 DATA_PREFIX = None  # No dataset loaded by default - user must select one
 SAMPLE_SIZE = 5000
 
-# In-memory cache for DataFrame to avoid reloading on every request
-df_cache = {
+# Empty state of the DataFrame cache; used to create and to reset it
+_EMPTY_DF_CACHE = {
     "data": None,
     "last_loaded": None,
     "target_key": None,
     "processing_manifest": None,
     "spot_channels_from_manifest": None,
     "sankey_data": None,  # Cache Sankey data to avoid recalculation
-    "unmixed_spots_filename": None  # Store unmixed spots filename for neuroglancer logic
+    "unmixed_spots_filename": None,  # Store unmixed spots filename for neuroglancer logic
+    "spot_details": None,
+    "fused_s3_paths": None,
 }
 
+# In-memory cache for DataFrame to avoid reloading on every request
+df_cache = dict(_EMPTY_DF_CACHE)
+
 
 def get_channel_pairs(df: pl.DataFrame) -> List[Tuple[str, str]]:
     """Extracts channel pairs from intensity column names."""
@@ -126,7 +133,7 @@ def calculate_sankey_data_from_polars(df_polars: pl.DataFrame) -> Dict[str, Any]
             (pl.col('unmixed_chan') == 'none') |
             (pl.col('unmixed_chan') == '')
         ).then(pl.lit('Removed'))
-        .otherwise(pl.col('unmixed_chan'))
+        .otherwise(pl.col('unmixed_chan').cast(pl.Utf8))
         .alias('final_chan')
     ])
     
@@ -223,7 +230,7 @@ def calculate_sankey_data(df: Any) -> Dict[str, Any]:
             (pl.col('unmixed_chan') == 'none') |
             (pl.col('unmixed_chan') == '')
         ).then(pl.lit('Removed'))
-        .otherwise(pl.col('unmixed_chan'))
+        .otherwise(pl.col('unmixed_chan').cast(pl.Utf8))
         .alias('final_chan')
     ])
     
@@ -404,7 +411,7 @@ async def get_real_spots_data(
             logger.info(f"Loaded merged Polars DataFrame shape: {df_polars.shape}")
             
             # Convert to pandas for frontend compatibility
-            df = df_polars.to_pandas()
+            df = spots_to_pandas(df_polars)
             logger.info(f"Converted to pandas DataFrame shape: {df.shape}")
 
             # Update cache
@@ -440,19 +447,21 @@ async def get_real_spots_data(
         related_files = find_related_files(S3_BUCKET, related_files_prefix, unmixed_target_key)
         logger.info(f"Searching for related files in '{related_files_prefix}'. Found: {related_files}")
 
-        # Load ratios file if found
-        if related_files['ratios']:
-            ratios_data = load_ratios_from_s3(S3_BUCKET, related_files['ratios'])
-            if ratios_data is not None:
-                logger.info(f"Loaded ratios matrix with shape: {ratios_data.shape}")
-        
-        # Load summary stats file if found
-        if related_files['summary_stats']:
-            summary_stats_df = load_summary_stats_from_s3(S3_BUCKET, related_files['summary_stats'])
-            if summary_stats_df is not None:
-                logger.info(f"Loaded summary stats with shape: {summary_stats_df.shape}")
-                summary_stats_data = summary_stats_df.to_dict(orient='records')
-                logger.info(f"Prepared {len(summary_stats_data)} summary stat records")
+        # Load ratios and summary stats files (if found) concurrently
+        related_data = await asyncio.to_thread(
+            load_related_files_from_s3, S3_BUCKET, related_files,
+            cache_dir=str(S3_CACHE_BASE)
+        )
+
+        ratios_data = related_data['ratios']
+        if ratios_data is not None:
+            logger.info(f"Loaded ratios matrix with shape: {ratios_data.shape}")
+
+        summary_stats_df = related_data['summary_stats']
+        if summary_stats_df is not None:
+            logger.info(f"Loaded summary stats with shape: {summary_stats_df.shape}")
+            summary_stats_data = summary_stats_df.to_dict(orient='records')
+            logger.info(f"Prepared {len(summary_stats_data)} summary stat records")
 
     # 4. Subsample the data
     if len(df) > sample_size:
@@ -509,7 +518,11 @@ async def get_real_spots_data(
     logger.info(f"Plotting DataFrame shape: {plot_df.shape}")
 
     # Add 'reassigned' column indicating where chan != unmixed_chan
-    plot_df['reassigned'] = plot_df['chan'] != plot_df['unmixed_chan']
+    # Compare values, not categorical codes (the two columns can carry
+    # different category sets, which pandas refuses to compare directly)
+    plot_df['reassigned'] = (
+        plot_df['chan'].to_numpy(dtype=object) != plot_df['unmixed_chan'].to_numpy(dtype=object)
+    )
     logger.info(f"Added 'reassigned' column. {plot_df['reassigned'].sum()} spots were reassigned.")
 
     # 5. Determine available channels and pairs
@@ -758,7 +771,7 @@ async def create_neuroglancer_link(request: Request):
     # Check existence of JSON on S3 (metadata only) for better diagnostics
     json_metadata = None
     try:
-        json_metadata = s3_handler.get_object_metadata(
+        json_metadata = await s3_handler.get_object_metadata_async(
             s3_key_for_json, bucket_name=S3_BUCKET
         )
         if json_metadata:
@@ -801,7 +814,9 @@ async def create_neuroglancer_link(request: Request):
                 ng_json_path,
             )
             try:
-                ng_link = ng_utils.create_link_from_json(
+                # S3 fetch + state rebuild is blocking; keep the event loop free
+                ng_link = await asyncio.to_thread(
+                    ng_utils.create_link_from_json,
                     ng_json_path=ng_json_path,
                     position=position,
                     spot_id=spot_id,
@@ -836,7 +851,8 @@ async def create_neuroglancer_link(request: Request):
                         "json_exists": json_metadata is not None,
                     },
                 )
-            ng_link = ng_utils.create_link_no_upload(
+            ng_link = await asyncio.to_thread(
+                ng_utils.create_link_no_upload,
                 fused_s3_paths,
                 annotation_color=annotation_color,
                 cross_section_scale=cross_section_scale,
@@ -975,7 +991,8 @@ async def create_neuroglancer_multi_annotations(request: Request):
         logger.info(f"Center position: {position}")
         
         # Create the neuroglancer link
-        ng_link = ng_utils.create_link_with_multiple_annotations(
+        ng_link = await asyncio.to_thread(
+            ng_utils.create_link_with_multiple_annotations,
             fused_s3_paths=fused_s3_paths,
             annotations=annotations,
             position=position,
@@ -1086,8 +1103,8 @@ async def download_dataset(request: Request):
         logger.info(f"Found dataset manifest at: s3://{S3_BUCKET}/{manifest_key}")
         
         # Download the processing manifest first
-        manifest_local_path = s3_handler.download_file(
-            key=manifest_key,
+        manifest_local_path = await s3_handler.download_file_async(
+            manifest_key,
             bucket_name=S3_BUCKET,
             use_cache=True
         )
@@ -1168,23 +1185,21 @@ async def download_dataset(request: Request):
             if parquet_file.exists():
                 downloaded_files.append(str(parquet_file))
             
-            if related_files['ratios']:
-                ratios_local_path = s3_handler.download_file(
-                    key=related_files['ratios'],
-                    bucket_name=S3_BUCKET,
-                    use_cache=True
-                )
-                if ratios_local_path:
-                    downloaded_files.append(str(ratios_local_path))
-            
-            if related_files['summary_stats']:
-                stats_local_path = s3_handler.download_file(
-                    key=related_files['summary_stats'],
-                    bucket_name=S3_BUCKET,
-                    use_cache=True
-                )
-                if stats_local_path:
-                    downloaded_files.append(str(stats_local_path))
+            # Fetch ratios and summary stats concurrently
+            related_keys = [
+                related_files[name]
+                for name in ('ratios', 'summary_stats')
+                if related_files[name]
+            ]
+            related_paths = await asyncio.to_thread(
+                s3_handler.download_files,
+                related_keys,
+                bucket_name=S3_BUCKET,
+                use_cache=True
+            )
+            for key in related_keys:
+                if related_paths.get(key):
+                    downloaded_files.append(str(related_paths[key]))
             
             return {
                 "success": True,
@@ -1218,14 +1233,7 @@ async def set_active_dataset(request: Request):
         DATA_PREFIX = dataset_name
         
         # Clear the cache to force reload with new dataset
-        df_cache["data"] = None
-        df_cache["last_loaded"] = None
-        df_cache["target_key"] = None
-        df_cache["processing_manifest"] = None
-        df_cache["spot_channels_from_manifest"] = None
-        df_cache["spot_details"] = None
-        df_cache["fused_s3_paths"] = None
-        df_cache["sankey_data"] = None
+        df_cache.update(_EMPTY_DF_CACHE)
         
         logger.info(f"Active dataset changed to: {dataset_name}")
         
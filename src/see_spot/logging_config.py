@@ -2,27 +2,36 @@ import sys
 import logging
 from logging.config import dictConfig
 
+# Level-independent parts of the logging configuration, built once at import.
+_FORMATTERS = {
+    "default": {
+        "format": "%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
+    },
+    "access": {
+        "format": "%(asctime)s | %(levelname)-8s | uvicorn.access | %(message)s",
+    },
+}
 
-def setup_logging(level: str = "DEBUG") -> None:
-    """Configure application and uvicorn logging in a single, idempotent place.
+# logger name -> (handler, propagate)
+_LOGGERS = {
+    # Project package
+    "see_spot": ("console", False),
+    # Uvicorn internals
+    "uvicorn": ("console", True),
+    "uvicorn.error": ("console", False),
+    "uvicorn.access": ("access_console", False),
+    # FastAPI / Starlette
+    "fastapi": ("console", True),
+}
 
-    Call this exactly once near process start (before creating the FastAPI app).
-    Safe to call multiple times; subsequent calls are no-ops.
-    """
-    if getattr(setup_logging, "_configured", False):  # idempotent guard
-        return
 
-    dictConfig({
+def _build_config(level: str) -> dict:
+    """Return the dictConfig mapping for ``level``."""
+    return {
         "version": 1,
         "disable_existing_loggers": False,
-        "formatters": {
-            "default": {
-                "format": "%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
-            },
-            "access": {
-                "format": "%(asctime)s | %(levelname)-8s | uvicorn.access | %(message)s",
-            },
-        },
+        # dictConfig converts nested mappings in place, so hand it copies
+        "formatters": {name: dict(fmt) for name, fmt in _FORMATTERS.items()},
         "handlers": {
             "console": {
                 "class": "logging.StreamHandler",
@@ -38,17 +47,24 @@ def setup_logging(level: str = "DEBUG") -> None:
             },
         },
         "loggers": {
-            # Project package
-            "see_spot": {"handlers": ["console"], "level": level, "propagate": False},
-            # Uvicorn internals
-            "uvicorn": {"handlers": ["console"], "level": level, "propagate": True},
-            "uvicorn.error": {"handlers": ["console"], "level": level, "propagate": False},
-            "uvicorn.access": {"handlers": ["access_console"], "level": level, "propagate": False},
-            # FastAPI / Starlette
-            "fastapi": {"handlers": ["console"], "level": level, "propagate": True},
+            name: {"handlers": [handler], "level": level, "propagate": propagate}
+            for name, (handler, propagate) in _LOGGERS.items()
         },
         "root": {"handlers": ["console"], "level": level},
-    })
+    }
+
+
+def setup_logging(level: str = "DEBUG") -> None:
+    """Configure application and uvicorn logging in a single, idempotent place.
+
+    Call this exactly once near process start (before creating the FastAPI app).
+    Safe to call multiple times; calls repeating the configured level are no-ops,
+    and only a different level rebuilds the handlers.
+    """
+    if getattr(setup_logging, "_configured_level", None) == level:  # idempotent guard
+        return
+
+    dictConfig(_build_config(level))
 
-    setup_logging._configured = True
+    setup_logging._configured_level = level
     logging.getLogger("see_spot.logging_config").debug("Logging configured (level=%s)", level)
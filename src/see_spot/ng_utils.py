@@ -6,16 +6,83 @@ on 2025-04-17
 import os
 import pathlib
 import re
-import subprocess
-import json
-import s3fs
-import zarr
-from ng_link import NgState
-from ng_link import link_utils
-import boto3
-
 import json
 import urllib.parse
+from functools import lru_cache
+from types import MappingProxyType
+
+import orjson
+
+# Matches the bucket and top-level dataset folder of an s3:// URI
+_S3_BUCKET_DATASET = re.compile(r"s3://([^/]+)/([^/]+)")
+_CHANNEL_RE = re.compile(r"(?:ch|CH|channel)_(\d+)")
+
+
+def _shared_s3_client():
+    """Return the app-wide boto3 client (shared pool, retries, credentials)."""
+    from see_spot.s3_handler import s3_handler
+
+    return s3_handler.s3_client
+
+
+def _parse_s3_uri(s3_path):
+    """
+    Split an S3 path into bucket and key.
+
+    Parameters:
+    s3_path (str): "s3://bucket/key" or "bucket/key"
+
+    Returns:
+    tuple: (bucket, key)
+    """
+    if s3_path.startswith("s3://"):
+        s3_path = s3_path[5:]
+    bucket, _, key = s3_path.partition("/")
+    return bucket, key
+
+
+# Image-layer fields that are identical for every channel. Only immutable
+# values live here; nested lists/dicts are created per layer.
+_IMAGE_LAYER_BASE = MappingProxyType(
+    {"type": "image", "channel": 0, "visible": True}
+)
+_SHADER_BASE = MappingProxyType({"emitter": "RGB", "vec": "vec3"})
+_ANNOTATION_LAYER_BASE = MappingProxyType(
+    {
+        "type": "annotation",
+        "tab": "annotations",
+        "visible": True,
+        "projectionAnnotationSpacing": 10,
+        "tool": "annotatePoint",
+    }
+)
+# Channel and time output dimensions do not depend on the dataset
+_BASE_DIMS = MappingProxyType(
+    {
+        "c'": MappingProxyType({"voxel_size": 1, "unit": ""}),
+        "t": MappingProxyType({"voxel_size": 0.001, "unit": "seconds"}),
+    }
+)
+
+
+def _json_loads(data):
+    """Parse JSON from str or bytes."""
+    return orjson.loads(data)
+
+
+def _json_dumps_bytes(data):
+    """Serialize to compact UTF-8 JSON bytes."""
+    try:
+        return orjson.dumps(
+            data,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
+    except TypeError:
+        # Types orjson can't serialize; let the stdlib have a go
+        pass
+    return json.dumps(
+        data, separators=(",", ":"), ensure_ascii=False
+    ).encode("utf-8")
 
 
 def create_direct_neuroglancer_url(
@@ -34,17 +101,17 @@ def create_direct_neuroglancer_url(
     """
     # Convert string to dictionary if needed
     if isinstance(json_data, str):
-        data = json.loads(json_data)
+        data = _json_loads(json_data)
     else:
-        data = json_data.copy()
+        data = json_data
 
-    # Remove the ng_link key if it exists
+    # Drop the ng_link key; only copy when there is something to remove so
+    # the caller's state is never mutated
     if "ng_link" in data:
-        del data["ng_link"]
+        data = {k: v for k, v in data.items() if k != "ng_link"}
 
-    # Convert to JSON string and encode for URL
-    json_str = json.dumps(data)
-    encoded_json = urllib.parse.quote(json_str)
+    # Serialize to compact JSON bytes and percent-encode them directly
+    encoded_json = urllib.parse.quote_from_bytes(_json_dumps_bytes(data))
 
     # Ensure base URL ends with /
     if not base_url.endswith("/"):
@@ -67,6 +134,175 @@ def create_direct_neuroglancer_url(
     return full_url
 
 
+def _build_image_layer(fused_path, max_dr, opacity, blend):
+    """
+    Build the Neuroglancer image layer for one fused channel zarr.
+
+    Parameters:
+    fused_path (str): S3 path to the fused channel (must contain ch_/channel_<n>)
+    max_dr (int): Maximum dynamic range for shader controls
+    opacity (float): Opacity value for the layer
+    blend (str): Blending mode for the layer
+
+    Returns:
+    dict: Image layer config
+    """
+    # Extract channel number from fused path
+    match = _CHANNEL_RE.search(fused_path)
+    if not match:
+        raise ValueError(
+            f"Could not extract channel number from path: {fused_path}"
+        )
+
+    channel = int(match.group(1))
+
+    return {
+        **_IMAGE_LAYER_BASE,
+        "source": fused_path,
+        "shaderControls": {"normalized": {"range": [90, max_dr]}},
+        "shader": {**_SHADER_BASE, "color": _wavelength_to_hex_str(channel)},
+        "localPosition": [0.5],
+        "opacity": opacity,
+        "name": f"CH_{channel}",
+        "blend": blend,
+    }
+
+
+def _build_image_layers(fused_s3_paths, max_dr, opacity, blend):
+    """Build image layers for each fused path, preserving input order."""
+    return [
+        _build_image_layer(fused_path, max_dr, opacity, blend)
+        for fused_path in fused_s3_paths
+    ]
+
+
+def _make_output_dimensions(res_z, res_y, res_x):
+    """
+    Return the Neuroglancer output dimensions for a z,y,x resolution.
+
+    The c'/t entries are shared read-only mappings; callers copy each axis
+    before handing the dimensions on.
+    """
+    return {
+        "x": {"voxel_size": res_x, "unit": "microns"},
+        "y": {"voxel_size": res_y, "unit": "microns"},
+        "z": {"voxel_size": res_z, "unit": "microns"},
+        **_BASE_DIMS,
+    }
+
+
+@lru_cache(maxsize=32)
+def _resolution_and_dims(s3_path):
+    """
+    Read the zarr resolution for ``s3_path`` and build its output dimensions.
+
+    Memoized per path so rendering many spots on one dataset only hits S3
+    once. Callers must copy the returned dimensions before mutating them.
+    Raises LookupError (not cached) if no resolution could be read.
+
+    Returns:
+    tuple: (resolution_zyx tuple, output dimensions dict)
+    """
+    resolution_zyx = _read_zarr_resolution_cached(s3_path)
+    return resolution_zyx, _make_output_dimensions(*resolution_zyx)
+
+
+def _resolve_output_dimensions(fused_s3_path, resolution_zyx=None):
+    """
+    Build a link's output dimensions, reading the resolution if not given.
+
+    Parameters:
+    fused_s3_path (list): S3 paths of the fused channels; the resolution is
+        read (once per dataset) from the first zarr
+    resolution_zyx (list, optional): Resolution in z,y,x order
+
+    Returns:
+    dict: Output dimensions, copied per axis so callers may mutate them
+    """
+    if resolution_zyx is None:
+        try:
+            resolution_zyx, dimensions = _resolution_and_dims(
+                fused_s3_path[0]
+            )
+            print(f"Found resolution from zarr: {list(resolution_zyx)}")
+        except Exception as e:
+            print(
+                f"Warning: Could not read resolution from zarr file: {str(e)}"
+            )
+            # Provide a default resolution if we can't read it
+            resolution_zyx = (1.0, 1.0, 1.0)
+            dimensions = _make_output_dimensions(*resolution_zyx)
+            print(f"Using default resolution: {list(resolution_zyx)}")
+    else:
+        dimensions = _make_output_dimensions(*resolution_zyx)
+
+    # Per-axis copies so the cached template is never mutated downstream
+    return {axis: dict(dim) for axis, dim in dimensions.items()}
+
+
+def _build_annotation_layer(name, annotation_color, spacing, annotations):
+    """
+    Build a Neuroglancer point-annotation layer.
+
+    Parameters:
+    name (str): Layer name
+    annotation_color (str): Color for the annotations
+    spacing (float): Cross-section annotation spacing
+    annotations (list): Point annotation dicts (type/id/point)
+
+    Returns:
+    dict: Annotation layer config
+    """
+    return {
+        **_ANNOTATION_LAYER_BASE,
+        "name": name,
+        "annotationColor": annotation_color,
+        "crossSectionAnnotationSpacing": spacing,
+        "annotations": annotations,
+    }
+
+
+def _build_ng_state(input_config, fused_path, json_name, output_folder=None):
+    """
+    Translate a layer/dimension config into a Neuroglancer state dict.
+
+    NgState converts the simplified config (shader dicts, voxel sizes, S3
+    sources) into Neuroglancer's schema. Only the in-memory state is used for
+    direct URLs, so nothing is written and the output folder is not created.
+
+    Parameters:
+    fused_path (str): S3 path used to derive the bucket and dataset name
+    json_name (str): File name NgState would use if the state were saved
+    output_folder (str, optional): Folder NgState would save into
+
+    Returns:
+    dict: Neuroglancer state
+    """
+    # Extract bucket and dataset from first fused path
+    match = _S3_BUCKET_DATASET.match(fused_path)
+    if not match:
+        raise ValueError(
+            f"Could not extract bucket and dataset from path: {fused_path}"
+        )
+    bucket_name, dataset_name = match.groups()
+
+    if output_folder is None:
+        output_folder = f"{os.getcwd()}/{dataset_name}/"
+
+    from ng_link import NgState
+
+    neuroglancer_link = NgState(
+        input_config,
+        "s3",
+        bucket_name,
+        output_folder,
+        dataset_name=pathlib.Path(output_folder).stem,
+        base_url="https://neuroglancer-demo.appspot.com",
+        json_name=json_name,
+    )
+    return neuroglancer_link.state
+
+
 def create_link_no_upload(
     fused_s3_path,
     resolution_zyx=None,
@@ -106,93 +342,26 @@ def create_link_no_upload(
     if isinstance(fused_s3_path, str):
         fused_s3_path = [fused_s3_path]
 
-    # If resolution not provided, try to read from first zarr file
-    if resolution_zyx is None:
-        try:
-            resolution_zyx = read_zarr_resolution_boto(fused_s3_path[0])
-            print(f"Found resolution from zarr: {resolution_zyx}")
-        except Exception as e:
-            print(
-                f"Warning: Could not read resolution from zarr file: {str(e)}"
-            )
-            # Provide a default resolution if we can't read it
-            resolution_zyx = [1.0, 1.0, 1.0]
-            print(f"Using default resolution: {resolution_zyx}")
-
-    output_dimensions = {
-        "x": {"voxel_size": resolution_zyx[2], "unit": "microns"},
-        "y": {"voxel_size": resolution_zyx[1], "unit": "microns"},
-        "z": {"voxel_size": resolution_zyx[0], "unit": "microns"},
-        "c'": {"voxel_size": 1, "unit": ""},
-        "t": {"voxel_size": 0.001, "unit": "seconds"},
-    }
-
-    # Initialize layers list
-    layers = []  # Represent Neuroglancer Tabs
-
-    # Process each fused path
-    for idx, fused_path in enumerate(fused_s3_path):
-        # Extract channel number from fused path
-        pattern = r"(ch|CH|channel)_(\d+)"
-        match = re.search(pattern, fused_path)
-        if not match:
-            raise ValueError(
-                f"Could not extract channel number from path: {fused_path}"
-            )
+    output_dimensions = _resolve_output_dimensions(
+        fused_s3_path, resolution_zyx
+    )
 
-        channel = int(match.group(2))
-        hex_val = wavelength_to_hex_pure_colours(channel)
-        hex_str = f"#{hex_val:06x}"
-
-        # Add image layer
-        image_layer = {
-            "type": "image",
-            "source": fused_path,
-            "channel": 0,
-            "shaderControls": {"normalized": {"range": [90, max_dr]}},
-            "shader": {
-                "color": hex_str,
-                "emitter": "RGB",
-                "vec": "vec3",
-            },
-            "localPosition": [0.5],
-            "visible": True,
-            "opacity": opacity,
-            "name": f"CH_{channel}",
-            "blend": blend,
-        }
-        layers.append(image_layer)
+    # Build one image layer per channel (Neuroglancer tabs)
+    layers = _build_image_layers(fused_s3_path, max_dr, opacity, blend)
 
     # Add specific point annotation if provided
     if point_annotation is not None:
         # convert output_dimensions to a meter]}
         # Create a single annotation layer for the point
-        annotation_layer = {
-            "type": "annotation",
-            # "source": {
-            #     "url":"local://annotations",
-            #     "transform": output_dimensions
-            # },
-            # "source": "local://annotations",
-            "name": f"Spot {spot_id}",
-            "tab": "annotations",
-            "visible": True,
-            "annotationColor": annotation_color,
-            "crossSectionAnnotationSpacing": spacing,
-            "projectionAnnotationSpacing": 10,
-            "tool": "annotatePoint",
-        }
-
-        # point = {"x":point_annotation[0], "y":point_annotation[1], "z":point_annotation[2], "t":point_annotation[3]}
-
         annotation = {
             "type": "point",
             "id": str(spot_id) if spot_id is not None else "spot",
             "point": point_annotation,
-            # "description": f"Spot ID: {spot_id}" if spot_id is not None else "Point annotation"
         }
 
-        annotation_layer["annotations"] = [annotation]
+        annotation_layer = _build_annotation_layer(
+            f"Spot {spot_id}", annotation_color, spacing, [annotation]
+        )
 
         # Use the point coordinates as the position if no position is specified
         if position is None:
@@ -210,33 +379,13 @@ def create_link_no_upload(
         "showAxisLines": False,
     }
 
-    # Extract bucket and dataset from first fused path
-    parts = fused_s3_path[0].split("/")
-    bucket_name = parts[2]
-    dataset_name = parts[3]
-
-    # Set up output folder
-    if output_folder is None:
-        cd = os.getcwd()
-        output_folder = f"{cd}/{dataset_name}/"
-    if not pathlib.Path(output_folder).exists():
-        pathlib.Path(output_folder).mkdir(parents=True, exist_ok=True)
-
     # Create JSON file name
     json_name = f"point_annotation_ng_link_{spot_id if spot_id is not None else 'spot'}.json"
 
     # Generate the Neuroglancer state
-    neuroglancer_link = NgState(
-        input_config,
-        "s3",
-        bucket_name,
-        output_folder,
-        dataset_name=pathlib.Path(output_folder).stem,
-        base_url="https://neuroglancer-demo.appspot.com",
-        json_name=json_name,
+    state_dict = _build_ng_state(
+        input_config, fused_s3_path[0], json_name, output_folder
     )
-
-    state_dict = neuroglancer_link.state
     # add crossSectionScale to state_dict
     # append annotation_layer to state_dict["layers"]
     # annotation_layer["source"]["transform"] = state_dict["dimensions"] # THIS BRINGS METERS IN
@@ -282,7 +431,6 @@ def create_link_from_json(
     --------
     str: Direct Neuroglancer URL with updated state
     """
-    import json
     from pathlib import Path
 
     # Robust handling of S3 vs local paths: avoid Path() on s3:// to prevent scheme collapse
@@ -291,20 +439,16 @@ def create_link_from_json(
 
     try:
         if is_s3:
-            s3_path = json_path_str[5:]  # strip 's3://'
-            parts = s3_path.split("/")
-            bucket = parts[0]
-            key = "/".join(parts[1:])
+            bucket, key = _parse_s3_uri(json_path_str)
             print(f"[ng_utils] Fetching Neuroglancer JSON from S3: bucket={bucket} key={key}")
-            s3_client = boto3.client("s3")
+            s3_client = _shared_s3_client()
             response = s3_client.get_object(Bucket=bucket, Key=key)
-            json_content = response["Body"].read().decode("utf-8")
-            state_dict = json.loads(json_content)
+            state_dict = _json_loads(response["Body"].read())
             print(f"Loaded Neuroglancer state from S3: s3://{bucket}/{key}")
         else:
             print(f"[ng_utils] Loading Neuroglancer JSON from local path: {json_path_str}")
-            with open(json_path_str, "r") as f:
-                state_dict = json.load(f)
+            with open(json_path_str, "rb") as f:
+                state_dict = _json_loads(f.read())
             print(f"Loaded Neuroglancer state from local file: {json_path_str}")
     except FileNotFoundError:
         raise FileNotFoundError(f"Neuroglancer JSON file not found: {json_path_str}")
@@ -349,109 +493,171 @@ def create_link_from_json(
         )
     ]
 
-    annotation_layer = {
-        "type": "annotation",
-        "name": spot_layer_name,
-        "tab": "annotations",
-        "visible": True,
-        "annotationColor": annotation_color,
-        "crossSectionAnnotationSpacing": spacing,
-        "projectionAnnotationSpacing": 10,
-        "tool": "annotatePoint",
-        "annotations": [
-            {
-                "type": "point",
-                "id": str(spot_id),
-                "point": point_annotation,
-            }
-        ],
-    }
+    annotation_layer = _build_annotation_layer(
+        spot_layer_name,
+        annotation_color,
+        spacing,
+        [{"type": "point", "id": str(spot_id), "point": point_annotation}],
+    )
     state_dict["layers"].append(annotation_layer)
     print(f"Appended new annotation layer with spot {spot_id}")
 
     # Generate direct URL
-    direct_url = create_direct_neuroglancer_url(state_dict, base_url=base_url)
+    return create_direct_neuroglancer_url(state_dict, base_url=base_url)
 
-    return direct_url
 
+def _resolution_from_zattrs(zattrs):
+    """
+    Extract the z,y,x resolution from parsed zarr group attributes.
 
-def read_zarr_resolution_boto(s3_path):
+    Parameters:
+    zattrs (dict): Contents of a group's .zattrs
+
+    Returns:
+    list: Resolution in z,y,x order, or None if not present
     """
-    Read resolution from zarr using direct S3 access via boto3
-    found s3fs/zarr was not working, so using boto3 (MD)
+    # Look for resolution in multiscales metadata
+    if "multiscales" in zattrs and zattrs["multiscales"]:
+        multiscale = zattrs["multiscales"][0]
+
+        if "axes" in multiscale:
+            axes = multiscale["axes"]
+            axes_map = {axis["name"]: i for i, axis in enumerate(axes)}
+
+            z_idx = axes_map.get("z")
+            y_idx = axes_map.get("y")
+            x_idx = axes_map.get("x")
+
+            if "datasets" in multiscale and multiscale["datasets"]:
+                dataset = multiscale["datasets"][0]
+                if "coordinateTransformations" in dataset:
+                    for transform in dataset["coordinateTransformations"]:
+                        if transform.get("type") == "scale":
+                            scale = transform["scale"]
+
+                            if all(
+                                idx is not None
+                                for idx in [z_idx, y_idx, x_idx]
+                            ):
+                                resolution = [
+                                    scale[z_idx],
+                                    scale[y_idx],
+                                    scale[x_idx],
+                                ]
+                                print(
+                                    f"Found resolution from multiscales: "
+                                    f"{resolution}"
+                                )
+                                return resolution
+
+    # Check for direct resolution attribute
+    if "resolution" in zattrs:
+        print(f"Found direct resolution attribute: {zattrs['resolution']}")
+        return list(zattrs["resolution"])
+
+    return None
+
+
+@lru_cache(maxsize=256)
+def _read_zarr_resolution_cached(s3_path):
+    """
+    Read the z,y,x resolution of a zarr on S3, memoized per path.
+
+    Only the root group metadata is fetched: .zattrs first, then the
+    consolidated .zmetadata if .zattrs is missing or has no resolution.
+    Each is a single GET, so no per-array metadata requests are made.
+    Failures raise LookupError so they are not cached and a later call
+    retries S3.
 
     Parameters:
     s3_path (str): S3 path to the zarr dataset
 
     Returns:
-    list: Resolution in z,y,x order in micrometers
+    tuple: Resolution in z,y,x order in micrometers
     """
-    import json
+    bucket, prefix = _parse_s3_uri(s3_path)
 
-    # Parse the S3 path
-    if s3_path.startswith("s3://"):
-        s3_path = s3_path[5:]  # Remove 's3://'
+    s3_client = _shared_s3_client()
+
+    for metadata_name in (".zattrs", ".zmetadata"):
+        metadata_key = f"{prefix}/{metadata_name}"
+        try:
+            print(f"Reading {metadata_key} from bucket {bucket}")
+            response = s3_client.get_object(Bucket=bucket, Key=metadata_key)
+            metadata = _json_loads(response["Body"].read())
+        except Exception as e:
+            print(f"Error reading {metadata_name}: {str(e)}")
+            continue
 
-    parts = s3_path.split("/")
-    bucket = parts[0]
-    prefix = "/".join(parts[1:])
+        if metadata_name == ".zmetadata":
+            # Consolidated metadata nests each key's JSON under "metadata"
+            metadata = metadata.get("metadata", {}).get(".zattrs", {})
 
-    # Create boto3 client
-    s3_client = boto3.client("s3")
+        resolution = _resolution_from_zattrs(metadata)
+        if resolution is not None:
+            return tuple(resolution)
+
+    raise LookupError(f"No resolution metadata found for {s3_path}")
+
+
+def read_zarr_resolution_boto(s3_path):
+    """
+    Read resolution from zarr using direct S3 access via boto3
+    found s3fs/zarr was not working, so using boto3 (MD)
 
+    Results are cached in-process per path; see _read_zarr_resolution_cached.
+
+    Parameters:
+    s3_path (str): S3 path to the zarr dataset
+
+    Returns:
+    list: Resolution in z,y,x order in micrometers
+    """
     try:
-        # Try to get the .zattrs file which should contain resolution metadata
-        zattrs_key = f"{prefix}/.zattrs"
-        print(f"Reading {zattrs_key} from bucket {bucket}")
-        response = s3_client.get_object(Bucket=bucket, Key=zattrs_key)
-        zattrs_content = response["Body"].read().decode("utf-8")
-        zattrs = json.loads(zattrs_content)
-
-        # Look for resolution in multiscales metadata
-        if "multiscales" in zattrs and zattrs["multiscales"]:
-            multiscale = zattrs["multiscales"][0]
-
-            if "axes" in multiscale:
-                axes = multiscale["axes"]
-                axes_map = {axis["name"]: i for i, axis in enumerate(axes)}
-
-                z_idx = axes_map.get("z")
-                y_idx = axes_map.get("y")
-                x_idx = axes_map.get("x")
-
-                if "datasets" in multiscale and multiscale["datasets"]:
-                    dataset = multiscale["datasets"][0]
-                    if "coordinateTransformations" in dataset:
-                        for transform in dataset["coordinateTransformations"]:
-                            if transform.get("type") == "scale":
-                                scale = transform["scale"]
-
-                                if all(
-                                    idx is not None
-                                    for idx in [z_idx, y_idx, x_idx]
-                                ):
-                                    print(
-                                        (
-                                            f"Found resolution from multiscales: "
-                                            f"{[scale[z_idx], scale[y_idx], scale[x_idx]]}"
-                                        )
-                                    )
-                                    return [
-                                        scale[z_idx],
-                                        scale[y_idx],
-                                        scale[x_idx],
-                                    ]
-
-        # Check for direct resolution attribute
-        if "resolution" in zattrs:
-            print(f"Found direct resolution attribute: {zattrs['resolution']}")
-            return list(zattrs["resolution"])
+        return list(_read_zarr_resolution_cached(s3_path))
+    except LookupError:
+        print(f"Using default resolution for {s3_path}")
+        return [1.0, 1.0, 1.0]
+
+
+# Each wavelength key is the upper bound to a wavelgnth band.
+# Wavelengths range from 380-750nm.
+# Color map wavelength/hex pairs are generated
+# by sampling along a CIE diagram arc.
+_WAVELENGTH_COLOR_MAP = {
+    0: 0xFFFFFF,  # white
+    1: 0x00FF00,  # Blue
+    2: 0xFF0000,  # Red
+    3: 0x0000FF,  # Blue
+    4: 0x00FFFF,  # cyan
+    5: 0xFF00FF,  # magenta   #638
+    # 420: 0xFFFFFF, #white       #405
+    # 490: 0x5DF8D6,  # Green     #488
+    # 520: 0x4B90FE,  # Blue      #515
+    # 570: 0xE9EC02,  # Yellow    #561
+    # 600: 0xF00050,  # Pink      #594
+    # 650: 0xF0121E,  # Red       #638
+    420: 0xFFFFFF,  # white       #405
+    490: 0x00FF00,  # Green     #488
+    520: 0xFF0000,  # Red       #515
+    570: 0x0000FF,  # Blue      #561
+    600: 0x00FFFF,  # cyan       #594 #600: 0xFFF000,  # Orange    #594 #or should be cyan?
+    650: 0xFF00FF,  # magenta   #638
+}
+
+
+def _scan_wavelength_color_map(wavelength):
+    """Band lookup by linear scan of _WAVELENGTH_COLOR_MAP."""
+    for ub, hex_val in _WAVELENGTH_COLOR_MAP.items():
+        if wavelength < ub:  # Exclusive
+            return hex_val
+    return hex_val  # hex_val is set to the last color in for loop
 
-    except Exception as e:
-        print(f"Error reading .zattrs: {str(e)}")
 
-    print(f"Using default resolution for {s3_path}")
-    return [1.0, 1.0, 1.0]
+# Precomputed colour for every integer wavelength 0..1023 (and its "#rrggbb"
+# string), so the per-layer lookup is a list index instead of a scan.
+_HEX_LUT = [_scan_wavelength_color_map(w) for w in range(1024)]
+_HEX_STR_LUT = [f"#{hex_val:06x}" for hex_val in _HEX_LUT]
 
 
 def wavelength_to_hex_pure_colours(wavelength: int) -> int:
@@ -466,35 +672,17 @@ def wavelength_to_hex_pure_colours(wavelength: int) -> int:
     int:
         Hex value color.
     """
+    if type(wavelength) is int and 0 <= wavelength < len(_HEX_LUT):
+        return _HEX_LUT[wavelength]
+    # Negative, out-of-table or non-integer wavelengths
+    return _scan_wavelength_color_map(wavelength)
 
-    # Each wavelength key is the upper bound to a wavelgnth band.
-    # Wavelengths range from 380-750nm.
-    # Color map wavelength/hex pairs are generated
-    # by sampling along a CIE diagram arc.
-    color_map = {
-        0: 0xFFFFFF,  # white
-        1: 0x00FF00,  # Blue
-        2: 0xFF0000,  # Red
-        3: 0x0000FF,  # Blue
-        4: 0x00FFFF,  # cyan
-        5: 0xFF00FF,  # magenta   #638
-        # 420: 0xFFFFFF, #white       #405
-        # 490: 0x5DF8D6,  # Green     #488
-        # 520: 0x4B90FE,  # Blue      #515
-        # 570: 0xE9EC02,  # Yellow    #561
-        # 600: 0xF00050,  # Pink      #594
-        # 650: 0xF0121E,  # Red       #638
-        420: 0xFFFFFF,  # white       #405
-        490: 0x00FF00,  # Green     #488
-        520: 0xFF0000,  # Red       #515
-        570: 0x0000FF,  # Blue      #561
-        600: 0x00FFFF,  # cyan       #594 #600: 0xFFF000,  # Orange    #594 #or should be cyan?
-        650: 0xFF00FF,  # magenta   #638
-    }
-    for ub, hex_val in color_map.items():
-        if wavelength < ub:  # Exclusive
-            return hex_val
-    return hex_val  # hex_val is set to the last color in for loop
+
+def _wavelength_to_hex_str(wavelength):
+    """Return the "#rrggbb" colour string for a wavelength."""
+    if type(wavelength) is int and 0 <= wavelength < len(_HEX_STR_LUT):
+        return _HEX_STR_LUT[wavelength]
+    return f"#{wavelength_to_hex_pure_colours(wavelength):06x}"
 
 
 def create_link_with_multiple_annotations(
@@ -543,84 +731,27 @@ def create_link_with_multiple_annotations(
     else:
         fused_s3_path = fused_s3_paths
 
-    # If resolution not provided, try to read from first zarr file
-    if resolution_zyx is None:
-        try:
-            resolution_zyx = read_zarr_resolution_boto(fused_s3_path[0])
-            print(f"Found resolution from zarr: {resolution_zyx}")
-        except Exception as e:
-            print(
-                f"Warning: Could not read resolution from zarr file: {str(e)}"
-            )
-            # Provide a default resolution if we can't read it
-            resolution_zyx = [1.0, 1.0, 1.0]
-            print(f"Using default resolution: {resolution_zyx}")
-
-    output_dimensions = {
-        "x": {"voxel_size": resolution_zyx[2], "unit": "microns"},
-        "y": {"voxel_size": resolution_zyx[1], "unit": "microns"},
-        "z": {"voxel_size": resolution_zyx[0], "unit": "microns"},
-        "c'": {"voxel_size": 1, "unit": ""},
-        "t": {"voxel_size": 0.001, "unit": "seconds"},
-    }
-
-    # Initialize layers list
-    layers = []
-
-    # Process each fused path to create image layers
-    for idx, fused_path in enumerate(fused_s3_path):
-        # Extract channel number from fused path
-        pattern = r"(ch|CH|channel)_(\d+)"
-        match = re.search(pattern, fused_path)
-        if not match:
-            raise ValueError(
-                f"Could not extract channel number from path: {fused_path}"
-            )
+    output_dimensions = _resolve_output_dimensions(
+        fused_s3_path, resolution_zyx
+    )
 
-        channel = int(match.group(2))
-        hex_val = wavelength_to_hex_pure_colours(channel)
-        hex_str = f"#{hex_val:06x}"
-
-        # Add image layer
-        image_layer = {
-            "type": "image",
-            "source": fused_path,
-            "channel": 0,
-            "shaderControls": {"normalized": {"range": [90, max_dr]}},
-            "shader": {
-                "color": hex_str,
-                "emitter": "RGB",
-                "vec": "vec3",
-            },
-            "localPosition": [0.5],
-            "visible": True,
-            "opacity": opacity,
-            "name": f"CH_{channel}",
-            "blend": blend,
-        }
-        layers.append(image_layer)
+    # Build one image layer per channel
+    layers = _build_image_layers(fused_s3_path, max_dr, opacity, blend)
 
     # Create annotation layer with multiple points
-    annotation_layer = {
-        "type": "annotation",
-        "name": layer_name,
-        "tab": "annotations",
-        "visible": True,
-        "annotationColor": annotation_color,
-        "crossSectionAnnotationSpacing": spacing,
-        "projectionAnnotationSpacing": 10,
-        "tool": "annotatePoint",
-        "annotations": []
-    }
-
-    # Add all annotations to the layer
-    for annot in annotations:
-        annotation = {
-            "type": "point",
-            "id": str(annot["spot_id"]),
-            "point": annot["point"],
-        }
-        annotation_layer["annotations"].append(annotation)
+    annotation_layer = _build_annotation_layer(
+        layer_name,
+        annotation_color,
+        spacing,
+        [
+            {
+                "type": "point",
+                "id": str(annot["spot_id"]),
+                "point": annot["point"],
+            }
+            for annot in annotations
+        ],
+    )
 
     print(f"Created annotation layer '{layer_name}' with {len(annotations)} points")
 
@@ -637,34 +768,14 @@ def create_link_with_multiple_annotations(
         "showAxisLines": False,
     }
 
-    # Extract bucket and dataset from first fused path
-    parts = fused_s3_path[0].split("/")
-    bucket_name = parts[2]
-    dataset_name = parts[3]
-
-    # Set up output folder
-    if output_folder is None:
-        cd = os.getcwd()
-        output_folder = f"{cd}/{dataset_name}/"
-    if not pathlib.Path(output_folder).exists():
-        pathlib.Path(output_folder).mkdir(parents=True, exist_ok=True)
-
     # Create JSON file name
     json_name = f"multi_annotation_ng_link_{len(annotations)}_spots.json"
 
     # Generate the Neuroglancer state
-    neuroglancer_link = NgState(
-        input_config,
-        "s3",
-        bucket_name,
-        output_folder,
-        dataset_name=pathlib.Path(output_folder).stem,
-        base_url="https://neuroglancer-demo.appspot.com",
-        json_name=json_name,
+    state_dict = _build_ng_state(
+        input_config, fused_s3_path[0], json_name, output_folder
     )
 
-    state_dict = neuroglancer_link.state
-
     # Add annotation layer and other state properties
     state_dict["layers"].append(annotation_layer)
     state_dict["crossSectionScale"] = cross_section_scale
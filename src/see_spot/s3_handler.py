@@ -3,16 +3,131 @@ S3 Handler Module for the view2p-E application.
 Manages connections and operations with AWS S3.
 """
 
+import asyncio
+import atexit
+import io
 import os
 import logging
+import threading
+import time
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Union
+from typing import Dict, Optional, Union
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Cached prefix listings (preload_keys/key_exists) expire after this many
+# seconds so objects written later are found, and at most this many prefixes
+# are kept (oldest evicted first)
+_KEY_CACHE_TTL_S = 60.0
+_KEY_CACHE_MAX_PREFIXES = 256
+
+_MB = 1024 * 1024
+
+# HTTPS connections the client keeps open; every concurrent request
+# (including each ranged GET of a multipart download) needs one
+_MAX_POOL_CONNECTIONS = 64
+
+# Connection pool sized for the parallel listing/download paths (the default
+# of 10 sockets would queue them), adaptive client-side retry rate limiting
+# (exponential backoff with jitter, up to 10 attempts) and TCP keepalive for
+# long-lived server connections.
+_CLIENT_CONFIG = Config(
+    max_pool_connections=_MAX_POOL_CONNECTIONS,
+    retries={"mode": "adaptive", "max_attempts": 10},
+    tcp_keepalive=True,
+)
+
+
+def _env_int(name, default):
+    """
+    Read a positive integer setting from the environment.
+
+    Malformed or non-positive values are logged and replaced by the default,
+    so a bad override can't break importing the module.
+    """
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        value = 0
+    if value <= 0:
+        logger.warning(
+            "Ignoring invalid %s=%r; using the default %s", name, raw, default
+        )
+        return default
+    return value
+
+
+# Multipart/ranged download settings: objects above the threshold are split
+# into 16 MB ranges fetched by up to 32 threads. Each knob can be overridden
+# through the environment (sizes in MB) to match the host's NIC.
+_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=_env_int("SEESPOT_S3_MULTIPART_THRESHOLD_MB", 16) * _MB,
+    multipart_chunksize=_env_int("SEESPOT_S3_MULTIPART_CHUNKSIZE_MB", 16) * _MB,
+    max_concurrency=_env_int("SEESPOT_S3_MAX_CONCURRENCY", 32),
+    io_chunksize=_env_int("SEESPOT_S3_IO_CHUNKSIZE_MB", 1) * _MB,
+    use_threads=True,
+)
+
+
+def _fanout_transfer_config(workers):
+    """
+    TransferConfig for one of ``workers`` concurrent file downloads.
+
+    Splits the connection pool between the files so workers x ranged-GET
+    threads never exceeds it (a single file keeps _TRANSFER_CONFIG).
+    """
+    per_file = max(
+        1,
+        min(_TRANSFER_CONFIG.max_concurrency, _MAX_POOL_CONNECTIONS // workers),
+    )
+    if per_file == _TRANSFER_CONFIG.max_concurrency:
+        return _TRANSFER_CONFIG
+    return TransferConfig(
+        multipart_threshold=_TRANSFER_CONFIG.multipart_threshold,
+        multipart_chunksize=_TRANSFER_CONFIG.multipart_chunksize,
+        max_concurrency=per_file,
+        io_chunksize=_TRANSFER_CONFIG.io_chunksize,
+        use_threads=per_file > 1,
+    )
+
+
+# Number of S3Handler clients built in this process; more than one usually
+# means a code path is bypassing the shared handler
+_clients_created = 0
+
+# Error codes S3 returns when a prefix is overloaded or a request times out
+_THROTTLE_CODES = frozenset(
+    {"SlowDown", "503", "RequestTimeout", "Throttling", "ThrottlingException"}
+)
+
+
+def _throttle_detail(error):
+    """
+    Describe a ClientError that survived all adaptive retries due to throttling.
+
+    Returns:
+        str: Suffix for the caller's error log, e.g.
+            " (throttled: SlowDown after 9 retries)"; empty for other errors
+    """
+    if not isinstance(error, ClientError):
+        return ""
+    code = error.response.get("Error", {}).get("Code")
+    if code not in _THROTTLE_CODES:
+        return ""
+    attempts = error.response.get("ResponseMetadata", {}).get(
+        "RetryAttempts"
+    )
+    return f" (throttled: {code} after {attempts} retries)"
+
 
 class S3Handler:
     """Handler for S3 operations."""
@@ -24,29 +139,72 @@ class S3Handler:
         Args:
             bucket_name (str, optional): Default S3 bucket name.
         """
+        self.session = None
         self.s3_client = None
         self.s3_resource = None
         self.bucket_name = bucket_name
+        # (bucket, prefix, delimiter) -> (monotonic time listed, set of keys)
+        self._key_cache = {}
+        self._key_cache_lock = threading.Lock()
+        # Directories already created by download_file
+        self._mkdir_cache = set()
+        self._mkdir_lock = threading.Lock()
         self.init_s3_client()
 
     def init_s3_client(self):
-        """Initialize the S3 client using credentials from environment variables."""
+        """
+        Initialize the S3 client using credentials from environment variables.
+
+        Creates exactly one client per handler. boto3 clients are thread-safe,
+        so every worker thread (parallel listing, downloads, ng_utils metadata
+        reads) must reuse ``self.s3_client`` and its connection pool rather
+        than building its own client.
+        """
+        global _clients_created
+        if _clients_created:
+            logger.warning(
+                "Creating an additional S3 client; prefer reusing "
+                "s3_handler.s3_client so connections are pooled"
+            )
         try:
             # Create S3 client - boto3 will automatically use AWS_ACCESS_KEY_ID,
             # AWS_SECRET_ACCESS_KEY, and AWS_SESSION_TOKEN from environment
-            self.s3_client = boto3.client("s3")
-            self.s3_resource = boto3.resource("s3")
+            # One session so credentials are resolved once, shared by the
+            # client and resource
+            self.session = boto3.session.Session()
+            self.s3_client = self.session.client("s3", config=_CLIENT_CONFIG)
+            self.s3_resource = self.session.resource(
+                "s3", config=_CLIENT_CONFIG
+            )
+            _clients_created += 1
             logger.info("S3 client initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize S3 client: {e}")
             raise
 
-    def test_connection(self, bucket_name=None):
+    def close(self):
+        """
+        Close the pooled HTTPS connections held by the client.
+
+        Registered with ``atexit`` for the shared handler so sockets are shut
+        down cleanly at interpreter exit; safe to call more than once.
+        """
+        client = self.s3_client
+        if client is None:
+            return
+        try:
+            client.close()
+        except Exception as e:
+            logger.debug(f"Error closing S3 client: {e}")
+
+    def test_connection(self, bucket_name=None, list_sample=True):
         """
         Test connection to S3 by listing objects in a bucket.
 
         Args:
             bucket_name (str, optional): S3 bucket name to test. Uses default if not provided.
+            list_sample (bool, optional): If False, only check connectivity with
+                a HEAD on the bucket instead of listing sample objects.
 
         Returns:
             dict: Test results with success status and message
@@ -60,6 +218,14 @@ class S3Handler:
             }
 
         try:
+            if not list_sample:
+                # Connectivity only - no listing needed
+                self.s3_client.head_bucket(Bucket=bucket)
+                return {
+                    "success": True,
+                    "message": f"Successfully connected to bucket '{bucket}'",
+                }
+
             # Try to list objects (limited to 5 for test)
             response = self.s3_client.list_objects_v2(Bucket=bucket, MaxKeys=5)
 
@@ -84,12 +250,13 @@ class S3Handler:
             error_code = e.response["Error"]["Code"]
             error_message = e.response["Error"]["Message"]
 
-            if error_code == "NoSuchBucket":
+            # head_bucket reports bare HTTP status codes
+            if error_code in ("NoSuchBucket", "404"):
                 return {
                     "success": False,
                     "message": f"Bucket '{bucket}' does not exist",
                 }
-            elif error_code == "AccessDenied":
+            elif error_code in ("AccessDenied", "403"):
                 return {
                     "success": False,
                     "message": f"Access denied to bucket '{bucket}'. Check your credentials and permissions.",
@@ -140,6 +307,137 @@ class S3Handler:
             logger.error(f"Error listing objects in bucket '{bucket}': {e}")
             return []
 
+    def list_objects_delim(self, bucket_name=None, prefix="", delimiter="/"):
+        """
+        List only the immediate children of a folder prefix.
+
+        S3 rolls everything below the next delimiter up into CommonPrefixes,
+        so the cost is proportional to the folder's direct children rather
+        than to every key in its subtree.
+
+        Args:
+            bucket_name (str, optional): S3 bucket name. Uses default if not provided.
+            prefix (str, optional): Folder prefix, normally ending in the delimiter
+            delimiter (str, optional): Folder separator
+
+        Returns:
+            tuple: (keys directly under prefix, sub-folder prefixes), both
+                empty on error
+        """
+        bucket = bucket_name or self.bucket_name
+
+        if not bucket:
+            logger.error("No bucket name provided")
+            return [], []
+
+        keys = []
+        sub_prefixes = []
+        try:
+            paginator = self.s3_client.get_paginator("list_objects_v2")
+            for page in paginator.paginate(
+                Bucket=bucket, Prefix=prefix, Delimiter=delimiter
+            ):
+                for obj in page.get("Contents", ()):
+                    keys.append(obj["Key"])
+                for common in page.get("CommonPrefixes", ()):
+                    sub_prefixes.append(common["Prefix"])
+        except Exception as e:
+            logger.error(
+                f"Error listing prefix '{prefix}' in bucket '{bucket}': {e}"
+            )
+            return [], []
+
+        return keys, sub_prefixes
+
+    def preload_keys(
+        self, prefix, bucket_name=None, delimiter=None, refresh=False
+    ):
+        """
+        List every key under a prefix once and cache the result.
+
+        Subsequent existence checks against the same prefix are set lookups
+        instead of one HEAD request per key. Listings are reused for
+        _KEY_CACHE_TTL_S seconds, then re-listed.
+
+        Args:
+            prefix (str): Key prefix to list
+            bucket_name (str, optional): S3 bucket name. Uses default if not provided.
+            delimiter (str, optional): If given (e.g. '/'), only keys directly
+                under the prefix are listed.
+            refresh (bool, optional): Re-list even if the prefix is cached
+
+        Returns:
+            set: Keys found under the prefix (empty on error)
+        """
+        bucket = bucket_name or self.bucket_name
+
+        if not bucket:
+            logger.error("No bucket name provided")
+            return set()
+
+        cache_key = (bucket, prefix, delimiter)
+        if not refresh:
+            entry = self._key_cache.get(cache_key)
+            if (
+                entry is not None
+                and time.monotonic() - entry[0] < _KEY_CACHE_TTL_S
+            ):
+                return entry[1]
+
+        params = {"Bucket": bucket, "Prefix": prefix}
+        if delimiter:
+            params["Delimiter"] = delimiter
+
+        try:
+            paginator = self.s3_client.get_paginator("list_objects_v2")
+            keys = set()
+            for page in paginator.paginate(**params):
+                for obj in page.get("Contents", ()):
+                    keys.add(obj["Key"])
+        except Exception as e:
+            logger.error(
+                f"Error listing prefix '{prefix}' in bucket '{bucket}': {e}"
+            )
+            return set()
+
+        # Empty listings are not cached so newly written objects are found
+        if keys:
+            with self._key_cache_lock:
+                # Re-insert so dict order tracks listing age
+                self._key_cache.pop(cache_key, None)
+                while len(self._key_cache) >= _KEY_CACHE_MAX_PREFIXES:
+                    del self._key_cache[next(iter(self._key_cache))]
+                self._key_cache[cache_key] = (time.monotonic(), keys)
+        logger.debug(f"Cached {len(keys)} keys under s3://{bucket}/{prefix}")
+        return keys
+
+    def key_exists(self, key, bucket_name=None, prefix=None, delimiter=None):
+        """
+        Check whether a key exists using the cached listing of its prefix.
+
+        Args:
+            key (str): Object key
+            bucket_name (str, optional): S3 bucket name. Uses default if not provided.
+            prefix (str, optional): Prefix to list. Defaults to the key's parent
+                "directory", listed with delimiter '/'.
+            delimiter (str, optional): Delimiter for the listing when a prefix
+                is given explicitly.
+
+        Returns:
+            bool: True if the key is in the listing
+        """
+        if prefix is None:
+            prefix = key.rpartition("/")[0] + "/" if "/" in key else ""
+            delimiter = "/"
+        return key in self.preload_keys(
+            prefix, bucket_name=bucket_name, delimiter=delimiter
+        )
+
+    def clear_key_cache(self):
+        """Drop all cached prefix listings."""
+        with self._key_cache_lock:
+            self._key_cache.clear()
+
     def get_object(self, key, bucket_name=None):
         """
         Get an object from S3.
@@ -163,9 +461,74 @@ class S3Handler:
         except Exception as e:
             logger.error(
                 f"Error getting object '{key}' from bucket '{bucket}': {e}"
+                f"{_throttle_detail(e)}"
+            )
+            return None
+
+    def get_streaming_body(self, key, bucket_name=None):
+        """
+        Open an object for streaming reads without buffering it.
+
+        The caller must close the returned body.
+
+        Args:
+            key (str): Object key
+            bucket_name (str, optional): S3 bucket name. Uses default if not provided.
+
+        Returns:
+            StreamingBody: File-like object body, or None if error
+        """
+        bucket = bucket_name or self.bucket_name
+
+        if not bucket:
+            logger.error("No bucket name provided")
+            return None
+
+        try:
+            response = self.s3_client.get_object(Bucket=bucket, Key=key)
+            return response["Body"]
+        except Exception as e:
+            logger.error(
+                f"Error opening object '{key}' from bucket '{bucket}': {e}"
+                f"{_throttle_detail(e)}"
             )
             return None
 
+    def download_to_buffer(self, key, bucket_name=None):
+        """
+        Download an object into memory using the multipart transfer manager.
+
+        Large objects are fetched as concurrent ranged GETs (see
+        ``_TRANSFER_CONFIG``) straight into an in-memory buffer, skipping the
+        local disk round trip of download_file.
+
+        Args:
+            key (str): Object key
+            bucket_name (str, optional): S3 bucket name. Uses default if not provided.
+
+        Returns:
+            io.BytesIO: Buffer positioned at the start, or None if error
+        """
+        bucket = bucket_name or self.bucket_name
+
+        if not bucket:
+            logger.error("No bucket name provided")
+            return None
+
+        buffer = io.BytesIO()
+        try:
+            self.s3_client.download_fileobj(
+                Bucket=bucket, Key=key, Fileobj=buffer, Config=_TRANSFER_CONFIG
+            )
+        except Exception as e:
+            logger.error(
+                f"Error downloading '{key}' from bucket '{bucket}' into memory: {e}"
+                f"{_throttle_detail(e)}"
+            )
+            return None
+        buffer.seek(0)
+        return buffer
+
     def get_object_metadata(self, key, bucket_name=None):
         """
         Get metadata for an object in S3, including size.
@@ -203,6 +566,7 @@ class S3Handler:
             else:
                 logger.error(
                     f"Error getting metadata for object '{key}' from bucket '{bucket}': {e}"
+                    f"{_throttle_detail(e)}"
                 )
             return None
         except Exception as e:
@@ -216,6 +580,8 @@ class S3Handler:
         local_path: Optional[Union[str, Path]] = None,
         use_cache: bool = True,
         cache_dir: Union[str, Path] = "/s3-cache",
+        validate: bool = False,
+        transfer_config: Optional[TransferConfig] = None,
     ) -> Optional[Path]:
         """
         Downloads a file from S3, optionally using a local cache.
@@ -229,6 +595,10 @@ class S3Handler:
                 Ignored if local_path is provided.
             cache_dir (str | Path, optional): Root directory for local caching.
                 Defaults to '/s3-cache'. Ignored if local_path is provided.
+            validate (bool, optional): If True, a cache hit is checked against the
+                object's size and LastModified (one HEAD) and re-downloaded if stale.
+            transfer_config (TransferConfig, optional): Multipart settings for
+                the transfer. Defaults to the module's _TRANSFER_CONFIG.
 
         Returns:
             Path: Path object to the local file (cached or downloaded), or None on error.
@@ -270,12 +640,16 @@ class S3Handler:
             if (
                 use_cache and effective_local_path.is_file()
             ):  # Check if it's actually a file
+                if not validate or self._cache_is_fresh(
+                    effective_local_path, key, bucket
+                ):
+                    logger.info(
+                        f"Cache hit! Using local file: {effective_local_path}"
+                    )
+                    return effective_local_path
                 logger.info(
-                    f"Cache hit! Using local file: {effective_local_path}"
+                    f"Cached file is stale, re-downloading: {effective_local_path}"
                 )
-                # Optional: Could add check here to compare S3 etag/last_modified
-                # with cached file metadata if cache invalidation is needed.
-                return effective_local_path
             elif use_cache:
                 logger.info(
                     f"Cache miss or not a file: {effective_local_path}"
@@ -288,16 +662,22 @@ class S3Handler:
         )
 
         try:
-            # Ensure parent directory exists
-            effective_local_path.parent.mkdir(parents=True, exist_ok=True)
+            # Ensure parent directory exists (memoized for cache paths only;
+            # explicit local paths are often one-off temp directories)
+            if is_cache_path:
+                self._ensure_dir(effective_local_path.parent)
+            else:
+                effective_local_path.parent.mkdir(parents=True, exist_ok=True)
 
-            # Use download_file for efficient transfer to disk
+            # Use download_file for efficient transfer to disk; large objects
+            # are fetched as parallel ranged GETs
             self.s3_client.download_file(
                 Bucket=bucket,
                 Key=key,
                 Filename=str(
                     effective_local_path
                 ),  # download_file expects a string path
+                Config=transfer_config or _TRANSFER_CONFIG,
             )
             logger.info(f"Successfully downloaded to: {effective_local_path}")
             return effective_local_path
@@ -316,6 +696,7 @@ class S3Handler:
             else:
                 logger.error(
                     f"S3 ClientError during download for key '{key}': {e}"
+                    f"{_throttle_detail(e)}"
                 )
             # Consider removing partially downloaded file if download_file guarantees creation
             # Check if file exists and maybe size is 0 before unlinking
@@ -327,16 +708,111 @@ class S3Handler:
             #      logger.error(f"Error removing incomplete file {effective_local_path}: {unlink_err}")
             return None
         except Exception as e:
+            if isinstance(e, FileNotFoundError):
+                # Cache directory removed underneath us; recreate next time
+                with self._mkdir_lock:
+                    self._mkdir_cache.discard(effective_local_path.parent)
             logger.error(
                 f"Unexpected error during download of '{key}': {e}",
                 exc_info=True,
             )
             return None
 
+    def download_files(
+        self,
+        keys,
+        bucket_name: Optional[str] = None,
+        use_cache: bool = True,
+        cache_dir: Union[str, Path] = "/s3-cache",
+        max_workers: int = 16,
+    ) -> Dict[str, Optional[Path]]:
+        """
+        Download several objects concurrently into the local cache.
+
+        Each key goes through download_file, so files land in the usual
+        cache layout (cache_dir/bucket/key) and existing cache hits are reused.
+        All workers share this handler's client and connection pool, so the
+        workers and each file's ranged-GET threads are sized to fit in it.
+
+        Args:
+            keys (Iterable[str]): S3 object keys.
+            bucket_name (str, optional): S3 bucket name. Uses handler's default if None.
+            use_cache (bool, optional): Passed through to download_file.
+            cache_dir (str | Path, optional): Root directory for local caching.
+            max_workers (int, optional): Maximum concurrent downloads, capped
+                at the client's connection pool size.
+
+        Returns:
+            dict: Mapping of key to local Path, or None for keys that failed.
+        """
+        keys = list(dict.fromkeys(keys))  # de-duplicate, keep order
+        if not keys:
+            return {}
+
+        workers = max(1, min(max_workers, len(keys), _MAX_POOL_CONNECTIONS))
+        transfer_config = _fanout_transfer_config(workers)
+
+        def _download(key):
+            return self.download_file(
+                key,
+                bucket_name=bucket_name,
+                use_cache=use_cache,
+                cache_dir=cache_dir,
+                transfer_config=transfer_config,
+            )
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(keys, executor.map(_download, keys)))
+
+    def _ensure_dir(self, path: Path) -> None:
+        """Create a directory (and parents) once per handler lifetime."""
+        if path in self._mkdir_cache:
+            return
+        path.mkdir(parents=True, exist_ok=True)
+        with self._mkdir_lock:
+            self._mkdir_cache.add(path)
+
+    def _cache_is_fresh(self, local_path: Path, key: str, bucket: str) -> bool:
+        """
+        Compare a cached file against the S3 object's size and LastModified.
+
+        Returns True (keep the cached copy) if the object can't be inspected.
+        """
+        metadata = self.get_object_metadata(key, bucket)
+        if metadata is None:
+            return True
+
+        stat = local_path.stat()
+        if metadata["ContentLength"] != stat.st_size:
+            return False
+        last_modified = metadata["LastModified"]
+        # Downloads are stamped with the local write time, so a newer S3
+        # object means it was overwritten after we cached it
+        return last_modified is None or last_modified.timestamp() <= stat.st_mtime
+
+    # --- asyncio wrappers ---
+    # boto3 is blocking; these run the sync methods on the default thread
+    # pool so FastAPI handlers can await (and gather) S3 I/O without
+    # stalling the event loop. They share this handler's client and its
+    # connection pool.
+
+    async def get_object_metadata_async(self, key, bucket_name=None):
+        """Async variant of get_object_metadata."""
+        return await asyncio.to_thread(
+            self.get_object_metadata, key, bucket_name
+        )
+
+    async def download_file_async(self, key, bucket_name=None, **kwargs):
+        """Async variant of download_file; kwargs are passed through."""
+        return await asyncio.to_thread(
+            self.download_file, key, bucket_name, **kwargs
+        )
+
 
 # Create a global instance for easy access
 # s3_handler = S3Handler('aind-open-data')
 s3_handler = S3Handler("codeocean-s3resultsbucket-1182nktl2bh9f")
+atexit.register(s3_handler.close)
 
 
 # Test function that can be called to verify connection
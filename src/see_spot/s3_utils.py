@@ -1,16 +1,24 @@
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Union
 import polars as pl
 import pandas as pd  # Keep for compatibility where needed
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 from see_spot.s3_handler import s3_handler
 from pathlib import Path
 import fnmatch
 import io
+import re
+from functools import lru_cache, partial
 import json  # Added for JSON parsing
+import orjson
 
 import logging
-import tempfile
+import mmap
+import pickle
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -18,6 +26,130 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def _list_cached(bucket: str, prefix: str) -> List[str]:
+    """
+    List the keys directly under a folder prefix, reusing a recent listing.
+
+    One fully paginated delimited LIST serves every finder for the folder;
+    subfolder contents (e.g. tile folders) are not listed. The listing is
+    cached by s3_handler.preload_keys, which expires it after
+    _KEY_CACHE_TTL_S and never caches an empty one.
+    """
+    return sorted(
+        s3_handler.preload_keys(prefix, bucket_name=bucket, delimiter="/")
+    )
+
+
+# Columns joining the mixed and unmixed spots tables
+_MERGE_KEYS = ("chan", "chan_spot_id")
+
+
+def _spots_to_polars(obj) -> pl.DataFrame:
+    """
+    Convert an unpickled spots table to Polars.
+
+    Pickled pyarrow Tables (the preferred upstream format) are wrapped without
+    a copy; pandas DataFrames are converted without the extra rechunk copy
+    (the merge that follows produces contiguous columns anyway).
+    """
+    if isinstance(obj, pa.Table):
+        return pl.from_arrow(obj, rechunk=False)
+    return pl.from_pandas(obj, rechunk=False, include_index=False)
+
+
+def _fetch_spots(bucket: str, key: str) -> Optional[pl.DataFrame]:
+    """
+    Download a pickled spots table into memory and load it into Polars.
+
+    Skips the temp-file write and re-read of a disk download; returns None
+    if the download fails. The table comes back already narrowed by
+    optimize_dtypes (Float64 -> Float32, Int32 ids, ...), so the merge gathers
+    half-width columns. The join keys keep their raw dtypes so both sides of
+    the join always agree; merge_spots_tables narrows them afterwards.
+    """
+    buffer = s3_handler.download_to_buffer(key=key, bucket_name=bucket)
+    if buffer is None:
+        return None
+    try:
+        obj = pickle.load(buffer)
+    except Exception as e:
+        # Compressed or older-pandas pickles
+        logger.debug(f"Plain unpickle of {key} failed ({e}); using pd.read_pickle")
+        buffer.seek(0)
+        obj = pd.read_pickle(buffer)
+    del buffer
+    return optimize_dtypes(_spots_to_polars(obj), keep_cols=_MERGE_KEYS)
+
+
+def _fsync_dir(path) -> None:
+    """Flush a directory entry so a rename into it survives a crash (POSIX only)."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# Version of the optimize_dtypes casting scheme baked into merged parquet
+# caches; bump when the scheme changes so older caches are re-cast on read
+_DTYPE_SCHEME_VERSION = 2
+
+
+def _dtype_meta_path(parquet_file: Path) -> Path:
+    """Path of the dtype scheme sidecar stored next to a parquet cache."""
+    return parquet_file.with_name(f"{parquet_file.name}.meta")
+
+
+def _read_dtype_scheme(parquet_file: Path) -> Optional[int]:
+    """Return the dtype scheme version recorded next to a parquet cache."""
+    try:
+        return json.loads(_dtype_meta_path(parquet_file).read_bytes())[
+            "dtype_scheme"
+        ]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _write_dtype_scheme(parquet_file: Path) -> None:
+    """Record the current dtype scheme version next to a parquet cache (best effort)."""
+    try:
+        _dtype_meta_path(parquet_file).write_text(
+            json.dumps({"dtype_scheme": _DTYPE_SCHEME_VERSION})
+        )
+    except OSError as e:
+        logger.warning(f"Could not write dtype scheme sidecar for {parquet_file}: {e}")
+
+
+# (bucket, dataset_name) -> manifest key; only hits are remembered
+_manifest_key_cache: Dict[tuple, str] = {}
+
+
+def _clear_lookup_cache() -> None:
+    """Forget cached folder listings and resolved manifest keys."""
+    _manifest_key_cache.clear()
+    s3_handler.clear_key_cache()
+
+
+def _read_pickle(path) -> Union[pd.DataFrame, pa.Table]:
+    """
+    Unpickle a DataFrame (or pyarrow Table) from a memory-mapped file.
+
+    The unpickler reads straight from the page cache instead of copying
+    through a userspace file buffer. Falls back to pd.read_pickle, which
+    also handles compressed and older-pandas pickles.
+    """
+    try:
+        with open(path, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mm:
+            return pickle.load(mm)
+    except Exception as e:
+        logger.debug(f"mmap unpickle of {path} failed ({e}); using pd.read_pickle")
+        return pd.read_pickle(path)
+
+
 def detect_tile_structure(bucket: str, dataset_name: str) -> List[str]:
     """
     Check if dataset has tile subfolders in image_spot_spectral_unmixing.
@@ -35,26 +167,23 @@ def detect_tile_structure(bucket: str, dataset_name: str) -> List[str]:
     spots_prefix = f"{dataset_name}/image_spot_spectral_unmixing/"
     
     try:
-        # List objects to check for tile folders
-        objects = s3_handler.list_objects(
-            bucket_name=bucket, prefix=spots_prefix, max_keys=500
+        # Only the folder's immediate children: tile folders come back as
+        # CommonPrefixes without listing the spots files inside them
+        objects, sub_prefixes = s3_handler.list_objects_delim(
+            bucket_name=bucket, prefix=spots_prefix
         )
-        
-        if not objects:
+
+        if not objects and not sub_prefixes:
             logger.info(f"No objects found at {spots_prefix}")
             return []
-        
+
         # Look for folders that start with "Tile" (case-insensitive)
         tile_folders = set()
-        for key in objects:
-            # Remove prefix to get relative path
-            relative_path = key[len(spots_prefix):] if key.startswith(spots_prefix) else key
-            
-            # Check if path contains a Tile folder
-            parts = relative_path.split('/')
-            if parts and parts[0].startswith(('Tile', 'tile')):
-                tile_folders.add(parts[0])
-        
+        for sub_prefix in sub_prefixes:
+            folder = sub_prefix[len(spots_prefix):].rstrip('/')
+            if folder.startswith(('Tile', 'tile')):
+                tile_folders.add(folder)
+
         tile_list = sorted(list(tile_folders))
         
         if tile_list:
@@ -96,29 +225,37 @@ def find_processing_manifest(bucket: str, dataset_name: str) -> Optional[str]:
     Returns:
         Full S3 key to the manifest file, or None if not found
     """
-    # Try both possible locations
-    possible_paths = [
-        f"{dataset_name}/processing_manifest.json",  # Top level
-        f"{dataset_name}/derived/processing_manifest.json",  # Derived folder
-    ]
+    cached = _manifest_key_cache.get((bucket, dataset_name))
+    if cached is not None:
+        return cached
+
+    root_prefix = f"{dataset_name}/"
+    top_level_key = f"{root_prefix}processing_manifest.json"
+    derived_prefix = f"{root_prefix}derived/"
 
     logger.info(
         f"Searching for processing_manifest.json in dataset '{dataset_name}'"
     )
 
-    for manifest_key in possible_paths:
-        logger.info(f"Checking: s3://{bucket}/{manifest_key}")
-        try:
-            # Try to get metadata (faster than downloading)
-            metadata = s3_handler.get_object_metadata(
-                key=manifest_key, bucket_name=bucket
-            )
-            if metadata is not None:
-                logger.info(f"Found processing manifest at: {manifest_key}")
-                return manifest_key
-        except Exception as e:
-            logger.debug(f"Manifest not found at {manifest_key}: {e}")
-            continue
+    # One delimited LIST of the dataset root answers the top-level candidate
+    # and tells us whether a derived/ folder exists at all
+    logger.info("Checking: s3://%s/%s", bucket, top_level_key)
+    keys, sub_prefixes = s3_handler.list_objects_delim(
+        bucket_name=bucket, prefix=root_prefix
+    )
+    manifest_key = None
+    if top_level_key in keys:
+        manifest_key = top_level_key
+    elif derived_prefix in sub_prefixes:
+        derived_key = f"{derived_prefix}processing_manifest.json"
+        logger.info("Checking: s3://%s/%s", bucket, derived_key)
+        if s3_handler.key_exists(derived_key, bucket_name=bucket):
+            manifest_key = derived_key
+
+    if manifest_key:
+        logger.info("Found processing manifest at: %s", manifest_key)
+        _manifest_key_cache[(bucket, dataset_name)] = manifest_key
+        return manifest_key
 
     logger.warning(
         f"Could not find processing_manifest.json in any expected location for dataset '{dataset_name}'"
@@ -126,65 +263,122 @@ def find_processing_manifest(bucket: str, dataset_name: str) -> Optional[str]:
     return None
 
 
-def optimize_dtypes(df: pl.DataFrame) -> pl.DataFrame:
-    """Optimize DataFrame dtypes to reduce memory usage.
+@lru_cache(maxsize=32)
+def _schema_cast_plan(
+    schema_items: tuple, downcast_floats: bool, keep_cols: tuple = ()
+):
+    """
+    Work out the schema-only part of optimize_dtypes for a (name, dtype) tuple.
 
-    Args:
-        df: Input Polars DataFrame
+    Columns in keep_cols are left untouched.
 
-    Returns:
-        DataFrame with optimized dtypes
+    Returns (cast pairs, Float64 columns whose downcast depends on the data).
+    Cached because the same schema is seen on every load of a dataset.
     """
-    logger.info("Optimizing data types for memory efficiency...")
-
     # Define columns that should remain as specific types
-    string_cols = ["chan", "unmixed_chan", "cell_id"]
+    # Channel labels have a handful of distinct values: store them as
+    # dictionary-encoded categoricals (u32 codes + one shared string table)
+    categorical_cols = ["chan", "unmixed_chan"]
+    string_cols = ["cell_id"]
     int_cols = ["spot_id", "chan_spot_id", "round"]
     bool_cols = ["valid_spot", "reassigned", "unmixed_removed"]
 
-    # Get current columns
-    current_cols = df.columns
-
-    # Build casting dictionary
-    cast_dict = {}
+    cast_items = []
+    float64_cols = []
 
-    for col in current_cols:
-        if col in string_cols:
-            cast_dict[col] = pl.Utf8
+    for col, dtype in schema_items:
+        if col in keep_cols:
+            continue
+        if col in categorical_cols:
+            target = pl.Categorical
+        elif col in string_cols:
+            target = pl.Utf8
         elif col in int_cols:
             # Use smaller int types where possible
             if col in ["round"]:
-                cast_dict[col] = pl.Int8  # rounds typically 1-10
+                target = pl.Int8  # rounds typically 1-10
             else:
-                cast_dict[
-                    col
-                ] = pl.Int32  # spot_ids can be large but usually fit in Int32
+                target = pl.Int32  # spot_ids can be large but usually fit in Int32
         elif col in bool_cols:
-            cast_dict[col] = pl.Boolean
-        elif df[col].dtype in [pl.Float64, pl.Float32]:
-            # Convert float64 to float32 for most numeric columns
-            # Check if values are small enough for float32
-            max_val = df[col].max()
-            min_val = df[col].min()
-            if max_val is not None and min_val is not None:
-                if (
-                    abs(max_val) < 3.4e38 and abs(min_val) < 3.4e38
-                ):  # Float32 range
-                    cast_dict[col] = pl.Float32
-                else:
-                    cast_dict[
-                        col
-                    ] = pl.Float64  # Keep as Float64 if values are too large
-
-    # Apply casting
+            target = pl.Boolean
+        else:
+            if dtype == pl.Float64 and downcast_floats:
+                float64_cols.append(col)
+            continue
+        # Columns already at the target type (e.g. read back from the
+        # parquet cache) need no cast
+        if dtype != target:
+            cast_items.append((col, target))
+
+    return tuple(cast_items), tuple(float64_cols)
+
+
+def optimize_dtypes(
+    df: pl.DataFrame, downcast_floats: bool = True, keep_cols: tuple = ()
+) -> pl.DataFrame:
+    """Optimize DataFrame dtypes to reduce memory usage.
+
+    Args:
+        df: Input Polars DataFrame
+        downcast_floats: If True, store Float64 columns as Float32 (about 7
+            significant digits) when their values fit the Float32 range
+        keep_cols: Columns to leave at their current dtype (e.g. join keys
+            that must match another table's)
+
+    Returns:
+        DataFrame with optimized dtypes
+    """
+    logger.info("Optimizing data types for memory efficiency...")
+
+    cast_items, float64_cols = _schema_cast_plan(
+        tuple(df.schema.items()), downcast_floats, tuple(keep_cols)
+    )
+    cast_dict = dict(cast_items)
+
+    if float64_cols:
+        # All min/max reductions in one parallel pass over the frame
+        bounds = df.select(
+            [pl.col(c).min().alias(f"{c}__min") for c in float64_cols]
+            + [pl.col(c).max().alias(f"{c}__max") for c in float64_cols]
+        ).row(0)
+        n = len(float64_cols)
+        for col, min_val, max_val in zip(float64_cols, bounds[:n], bounds[n:]):
+            if (
+                min_val is not None
+                and max_val is not None
+                and abs(max_val) < 3.4e38
+                and abs(min_val) < 3.4e38
+            ):  # Float32 range
+                cast_dict[col] = pl.Float32
+
+    # Apply all casts as one batch of expressions
     if cast_dict:
-        df_optimized = df.cast(cast_dict)
+        df_optimized = df.with_columns(
+            [pl.col(col).cast(dtype) for col, dtype in cast_dict.items()]
+        )
         logger.info(f"Optimized {len(cast_dict)} columns to smaller dtypes")
         return df_optimized
     else:
         return df
 
 
+def spots_to_pandas(df: pl.DataFrame) -> pd.DataFrame:
+    """Convert a spots table to pandas for the JSON endpoints.
+
+    Categorical columns are cast back to strings first: a pandas
+    ``category`` column turns nulls (e.g. unmixed_chan of removed spots)
+    into NaN, which the JSON response cannot encode.
+    """
+    categorical_cols = [
+        col for col, dtype in df.schema.items() if dtype == pl.Categorical
+    ]
+    if categorical_cols:
+        df = df.with_columns(
+            [pl.col(col).cast(pl.Utf8) for col in categorical_cols]
+        )
+    return df.to_pandas()
+
+
 def merge_spots_tables(spots_mixed, spots_unmixed):
     """Merge mixed and unmixed spots tables using Polars.
 
@@ -195,38 +389,102 @@ def merge_spots_tables(spots_mixed, spots_unmixed):
     Returns:
         pl.DataFrame: Merged DataFrame with unmixed_removed column
     """
-    mixed_clean = spots_mixed.drop("spot_id", strict=False)
-    unmixed_clean = spots_unmixed.drop("spot_id", strict=False)
+    # Build the whole merge as one lazy query and materialize it once
+    mixed_clean = spots_mixed.lazy().drop("spot_id", strict=False)
+    unmixed_clean = spots_unmixed.lazy().drop("spot_id", strict=False)
 
     # Get columns that are unique to unmixed table
-    mixed_cols = set(mixed_clean.columns)
-    unmixed_cols = set(unmixed_clean.columns)
-    unique_unmixed_cols = list(unmixed_cols - mixed_cols)
+    mixed_cols = set(mixed_clean.collect_schema().names())
+    unmixed_cols = unmixed_clean.collect_schema().names()
+    unique_unmixed_cols = [c for c in unmixed_cols if c not in mixed_cols]
 
-    # Keep only merge keys and unique columns from unmixed
-    merge_keys = ["chan", "chan_spot_id"]
-    select_cols = merge_keys + unique_unmixed_cols
-    unmixed_subset = unmixed_clean.select(select_cols)
-    merged = mixed_clean.join(unmixed_subset, on=merge_keys, how="left")
+    merge_keys = list(_MERGE_KEYS)
 
-    # Add unmixed_removed column - True where any unique unmixed column is null
     if unique_unmixed_cols:
-        # Create condition: all unique unmixed columns are null
-        null_conditions = [
+        # Keep only merge keys and unique columns from unmixed
+        select_cols = merge_keys + unique_unmixed_cols
+        unmixed_subset = unmixed_clean.select(select_cols)
+        # Keep the mixed table's row order: spot_id numbers rows in that order
+        merged = mixed_clean.join(
+            unmixed_subset, on=merge_keys, how="left", maintain_order="left"
+        )
+
+        # Add unmixed_removed column - True where all unique unmixed columns are null
+        all_null = pl.all_horizontal(
             pl.col(col).is_null() for col in unique_unmixed_cols
-        ]
-        all_null = pl.fold(True, lambda acc, x: acc & x, null_conditions)
+        )
         merged = merged.with_columns(unmixed_removed=all_null)
     else:
-        merged = merged.with_columns(unmixed_removed=pl.lit(False))
+        # Nothing to bring over from unmixed: skip the join entirely
+        merged = mixed_clean.with_columns(
+            unmixed_removed=pl.lit(False, dtype=pl.Boolean)
+        )
 
-    merged_with_id = merged.with_row_index(name="spot_id", offset=1)
+    # spot_id numbers every merged row, so the valid_spot filter stays with
+    # the caller (it must run after the ids are assigned)
+    merged_with_id = merged.with_row_index(name="spot_id", offset=1).collect()
     merged_optimized = optimize_dtypes(merged_with_id)
 
     logger.info(f"Merge completed. Final shape: {merged_optimized.shape}")
     return merged_optimized
 
 
+@lru_cache(maxsize=32)
+def _compile_glob(pattern: str):
+    """Compile a filename glob once; returns the regex's match method."""
+    return re.compile(fnmatch.translate(pattern)).match
+
+
+def _glob_literal_prefix(pattern: str) -> str:
+    """Leading part of a glob before its first wildcard (e.g. 'unmixed_spots_')."""
+    for i, char in enumerate(pattern):
+        if char in "*?[":
+            return pattern[:i]
+    return pattern
+
+
+def _find_top_level_file(
+    bucket: str, prefix: str, pattern: str, description: str
+) -> Optional[str]:
+    """
+    Return the first key directly under prefix whose filename matches the glob.
+
+    Keys come from the short-lived listing cache, so the unmixed, mixed and
+    related-file lookups for one folder share a single paginated LIST.
+    """
+    match = _compile_glob(pattern)
+    # Only keys starting with the glob's literal head can match
+    match_prefix = prefix + _glob_literal_prefix(pattern)
+
+    objects = _list_cached(bucket, prefix)
+    for i, key in enumerate(objects):
+        if not key.startswith(match_prefix):
+            continue
+        if match(key.rpartition('/')[2]):
+            logger.info("Found matching %s: %s", description, key)
+            if logger.isEnabledFor(logging.DEBUG):
+                # Ambiguity check only when someone is looking at debug logs
+                others = [
+                    k for k in objects[i + 1:]
+                    if k.startswith(match_prefix) and match(k.rpartition('/')[2])
+                ]
+                if others:
+                    logger.debug(
+                        "%d more %ss match '%s'; using the first: %s",
+                        len(others), description, pattern, others,
+                    )
+            return key
+
+    if not objects:
+        logger.warning(f"No objects found with prefix '{prefix}'.")
+    else:
+        logger.warning(
+            f"No {description}s matching pattern '{pattern}' found among "
+            f"{len(objects)} objects listed under prefix '{prefix}'."
+        )
+    return None
+
+
 def find_mixed_spots_file(
     bucket: str, prefix: str, pattern: str
 ) -> Optional[str]:
@@ -235,44 +493,7 @@ def find_mixed_spots_file(
         f"Searching for mixed spots pattern '{pattern}' in bucket '{bucket}' with prefix '{prefix}'..."
     )
     try:
-        # List objects - consider increasing max_keys if many files share the prefix
-        objects = s3_handler.list_objects(
-            bucket_name=bucket, prefix=prefix, max_keys=200
-        )
-        if not objects:
-            logger.warning(f"No objects found with prefix '{prefix}'.")
-            return None
-
-        found_files = []
-        for key in objects:
-            # Skip objects in subdirectories - only check files at the top level
-            # Remove the prefix and check if there are any additional slashes
-            relative_path = key[len(prefix):] if key.startswith(prefix) else key
-            # If there's a slash in the relative path, it's in a subdirectory
-            if '/' in relative_path.lstrip('/'):
-                continue
-            
-            # Use Pathlib to easily get the filename part of the key
-            filename = Path(key).name
-            if fnmatch.fnmatch(filename, pattern):
-                logger.info(f"Found matching mixed spots file: {key}")
-                found_files.append(key)
-
-        if not found_files:
-            logger.warning(
-                f"No mixed spots files matching pattern '{pattern}' found within "
-                f"the first {len(objects)} objects listed under prefix '{prefix}'."
-            )
-            return None
-
-        if len(found_files) > 1:
-            logger.warning(
-                f"Multiple mixed spots files ({len(found_files)}) matching pattern found. "
-                f"Using the first one: {found_files[0]}"
-            )
-
-        return found_files[0]  # Return the full key of the first match
-
+        return _find_top_level_file(bucket, prefix, pattern, "mixed spots file")
     except Exception as e:
         logger.error(
             f"Error listing or searching objects: {e}", exc_info=True
@@ -348,16 +569,26 @@ def load_and_merge_spots_from_s3(
     if parquet_file.exists():
         logger.info(f"Loading merged data from cached parquet: {parquet_file}")
         try:
-            df = pl.read_parquet(parquet_file)
-            # Optimize data types and filter for valid spots
-            df_optimized = optimize_dtypes(df)
+            lf = pl.scan_parquet(parquet_file)
+            # valid_spot is pushed into the scan, so row groups without valid
+            # spots are skipped via their statistics
+            if valid_spots_only:
+                lf = lf.filter(pl.col("valid_spot"))
+            # The file is clustered for row-group skipping; rows go back to
+            # spot_id order so seeded sampling picks the same spots as a
+            # fresh merge (and as caches written in spot_id order)
+            if "spot_id" in lf.collect_schema().names():
+                lf = lf.sort("spot_id")
+            df_final = lf.collect(engine="streaming")
+            # Files written under the current dtype scheme are already
+            # optimized; older caches are upgraded in memory
+            if _read_dtype_scheme(parquet_file) != _DTYPE_SCHEME_VERSION:
+                df_final = optimize_dtypes(df_final)
             if valid_spots_only:
-                df_final = df_optimized.filter(pl.col("valid_spot"))
                 logger.info(
                     f"Loaded DataFrame from parquet (valid spots only). Shape: {df_final.shape}"
                 )
             else:
-                df_final = df_optimized
                 logger.info(
                     f"Loaded DataFrame from parquet (all spots). Shape: {df_final.shape}"
                 )
@@ -396,88 +627,95 @@ def load_and_merge_spots_from_s3(
     logger.info(f"Found unmixed file: {unmixed_key}")
     logger.info(f"Found mixed file: {mixed_key}")
 
-    # 3. Download both files to cache tmp directory
-    # Create tmp directory in cache instead of system /tmp
-    cache_tmp_dir = Path(cache_dir) / "tmp"
-    cache_tmp_dir.mkdir(parents=True, exist_ok=True)
-    
-    with tempfile.TemporaryDirectory(dir=str(cache_tmp_dir)) as tmp_dir:
-        tmp_dir_path = Path(tmp_dir)
-
-        # Download unmixed file
-        unmixed_tmp_path = tmp_dir_path / f"unmixed_{os.getpid()}.pkl"
-        logger.info(f"Downloading unmixed file to {unmixed_tmp_path}")
-        unmixed_local = s3_handler.download_file(
-            key=unmixed_key,
-            bucket_name=bucket,
-            local_path=str(unmixed_tmp_path),
-            use_cache=False,
-        )
-        if not unmixed_local:
-            logger.error("Failed to download unmixed spots file")
-            return None
-
-        # Download mixed file
-        mixed_tmp_path = tmp_dir_path / f"mixed_{os.getpid()}.pkl"
-        logger.info(f"Downloading mixed file to {mixed_tmp_path}")
-        mixed_local = s3_handler.download_file(
-            key=mixed_key,
-            bucket_name=bucket,
-            local_path=str(mixed_tmp_path),
-            use_cache=False,
-        )
-        if not mixed_local:
-            logger.error("Failed to download mixed spots file")
-            return None
-
-        # 4. Load both DataFrames using Polars (via pandas for pickle support)
-        try:
-            logger.info("Loading unmixed spots DataFrame...")
-            df_unmixed_pd = pd.read_pickle(unmixed_local)
-            df_unmixed = pl.from_pandas(df_unmixed_pd)
-            logger.info(f"Loaded unmixed DataFrame. Shape: {df_unmixed.shape}")
-
-            logger.info("Loading mixed spots DataFrame...")
-            df_mixed_pd = pd.read_pickle(mixed_local)
-            df_mixed = pl.from_pandas(df_mixed_pd)
-            logger.info(f"Loaded mixed DataFrame. Shape: {df_mixed.shape}")
-        except Exception as e:
-            logger.error(f"Error loading pickle files: {e}", exc_info=True)
-            return None
-
-        # 5. Merge the DataFrames
-        try:
-            logger.info("Merging DataFrames...")
-            df_merged = merge_spots_tables(df_mixed, df_unmixed)
-            logger.info(f"Merged DataFrame. Shape: {df_merged.shape}")
-        except Exception as e:
-            logger.error(f"Error merging DataFrames: {e}", exc_info=True)
-            return None
+    # 3. Fetch both pickles into memory and unpickle them; the two
+    # downloads (and their decoding) are independent, so overlap them
+    logger.info("Downloading and loading unmixed and mixed spots files...")
+    try:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            unmixed_future = executor.submit(_fetch_spots, bucket, unmixed_key)
+            mixed_future = executor.submit(_fetch_spots, bucket, mixed_key)
+            df_unmixed = unmixed_future.result()
+            df_mixed = mixed_future.result()
+    except Exception as e:
+        logger.error(f"Error loading pickle files: {e}", exc_info=True)
+        return None
 
-        # 7. Save merged result as parquet to cache
-        try:
-            # Ensure cache directory exists
-            local_cache_dir.mkdir(parents=True, exist_ok=True)
+    if df_unmixed is None:
+        logger.error("Failed to download unmixed spots file")
+        return None
+    if df_mixed is None:
+        logger.error("Failed to download mixed spots file")
+        return None
+    logger.info(f"Loaded unmixed DataFrame. Shape: {df_unmixed.shape}")
+    logger.info(f"Loaded mixed DataFrame. Shape: {df_mixed.shape}")
 
-            logger.info(f"Saving merged DataFrame to parquet: {parquet_file}")
-            df_merged.write_parquet(parquet_file, compression="snappy")
-            logger.info(f"Successfully saved merged data to {parquet_file}")
-        except Exception as e:
-            logger.error(f"Error saving parquet file: {e}", exc_info=True)
-            # Continue anyway - we have the data in memory
+    # 4. Merge the DataFrames
+    try:
+        logger.info("Merging DataFrames...")
+        df_merged = merge_spots_tables(df_mixed, df_unmixed)
+        logger.info(f"Merged DataFrame. Shape: {df_merged.shape}")
+    except Exception as e:
+        logger.error(f"Error merging DataFrames: {e}", exc_info=True)
+        return None
 
-        # 8. Filter for valid spots (if requested) and return
-        if valid_spots_only:
-            df_final = df_merged.filter(pl.col("valid_spot"))
-            logger.info(
-                f"Returning valid spots DataFrame. Shape: {df_final.shape}"
-            )
-        else:
-            df_final = df_merged
-            logger.info(
-                f"Returning all spots DataFrame. Shape: {df_final.shape}"
+    # 5. Save merged result as parquet to cache
+    # Write next to the target and rename into place so a crash
+    # mid-write never leaves a truncated cache file behind
+    tmp_parquet = parquet_file.with_name(
+        f"{parquet_file.name}.{os.getpid()}.tmp"
+    )
+    try:
+        # Ensure cache directory exists
+        local_cache_dir.mkdir(parents=True, exist_ok=True)
+
+        logger.info(f"Saving merged DataFrame to parquet: {parquet_file}")
+        # Valid spots first, then clustered by (chan, round), so row-group
+        # min/max statistics let the valid_spot and channel filters skip
+        # whole groups; stable sort keeps spot_id order within each group.
+        # Only the file is reordered: the returned frame stays in spot_id
+        # order. chan is sorted by label, not by categorical code.
+        sort_cols = [
+            c for c in ("valid_spot", "chan", "round") if c in df_merged.columns
+        ]
+        df_to_write = df_merged
+        if sort_cols:
+            df_to_write = df_merged.sort(
+                [
+                    pl.col(c).cast(pl.Utf8) if c == "chan" else pl.col(c)
+                    for c in sort_cols
+                ],
+                descending=[c == "valid_spot" for c in sort_cols],
+                maintain_order=True,
             )
-        return df_final
+        df_to_write.write_parquet(
+            tmp_parquet,
+            compression="zstd",
+            compression_level=3,
+            statistics=True,
+            row_group_size=200_000,
+        )
+        del df_to_write
+        os.replace(tmp_parquet, parquet_file)
+        _fsync_dir(local_cache_dir)
+        _write_dtype_scheme(parquet_file)
+        logger.info(f"Successfully saved merged data to {parquet_file}")
+    except Exception as e:
+        logger.error(f"Error saving parquet file: {e}", exc_info=True)
+        tmp_parquet.unlink(missing_ok=True)
+        # Continue anyway - we have the data in memory
+
+    # 6. Filter for valid spots (if requested) and return
+    if valid_spots_only:
+        df_final = df_merged.filter(pl.col("valid_spot"))
+        logger.info(
+            f"Returning valid spots DataFrame. Shape: {df_final.shape}"
+        )
+    else:
+        df_final = df_merged
+        logger.info(
+            f"Returning all spots DataFrame. Shape: {df_final.shape}"
+        )
+    return df_final
 
 
 def find_unmixed_spots_file(
@@ -488,44 +726,7 @@ def find_unmixed_spots_file(
         f"Searching for pattern '{pattern}' in bucket '{bucket}' with prefix '{prefix}'..."
     )
     try:
-        # List objects - consider increasing max_keys if many files share the prefix
-        objects = s3_handler.list_objects(
-            bucket_name=bucket, prefix=prefix, max_keys=200
-        )
-        if not objects:
-            logger.warning(f"No objects found with prefix '{prefix}'.")
-            return None
-
-        found_files = []
-        for key in objects:
-            # Skip objects in subdirectories - only check files at the top level
-            # Remove the prefix and check if there are any additional slashes
-            relative_path = key[len(prefix):] if key.startswith(prefix) else key
-            # If there's a slash in the relative path, it's in a subdirectory
-            if '/' in relative_path.lstrip('/'):
-                continue
-            
-            # Use Pathlib to easily get the filename part of the key
-            filename = Path(key).name
-            if fnmatch.fnmatch(filename, pattern):
-                logger.info(f"Found matching file: {key}")
-                found_files.append(key)
-
-        if not found_files:
-            logger.warning(
-                f"No files matching pattern '{pattern}' found within "
-                f"the first {len(objects)} objects listed under prefix '{prefix}'."
-            )
-            # Consider adding logic here to list more objects if needed (pagination)
-            return None
-
-        if len(found_files) > 1:
-            logger.warning(
-                f"Multiple files ({len(found_files)}) matching pattern found. Using the first one: {found_files[0]}"
-            )
-
-        return found_files[0]  # Return the full key of the first match
-
+        return _find_top_level_file(bucket, prefix, pattern, "file")
     except Exception as e:
         logger.error(
             f"Error listing or searching objects: {e}", exc_info=True
@@ -533,8 +734,14 @@ def find_unmixed_spots_file(
         return None
 
 
+_RELATED_SUFFIXES = ("_ratios.txt", "summary_stats.csv")
+
+
 def find_related_files(
-    bucket: str, prefix: str, spots_file: str
+    bucket: str,
+    prefix: str,
+    spots_file: str,
+    objects: Optional[List[str]] = None,
 ) -> Dict[str, str]:
     """
     Find related ratios.txt and summary_stats.csv files based on the unmixed spots file pattern.
@@ -547,6 +754,9 @@ def find_related_files(
         S3 prefix (folder path)
     spots_file: str
         Full key of the spots file that was found
+    objects: Optional[List[str]]
+        Keys already listed under prefix; listed (via the short-lived
+        listing cache) if not given
 
     Returns:
     --------
@@ -557,25 +767,25 @@ def find_related_files(
 
     try:
         # List objects in the same directory
-        objects = s3_handler.list_objects(
-            bucket_name=bucket, prefix=prefix, max_keys=200
-        )
-        print(objects)
-
-        # Look for ratios.txt
-        for key in objects:
-            filename = Path(key).name
-            if "_ratios.txt" in filename:
-                logger.info(f"Found ratios file: {key}")
-                result["ratios"] = key
-                break
-
-        # Look for summary_stats.csv
+        if objects is None:
+            # Siblings of the spots file (same folder as the search prefix
+            # for top-level matches)
+            sibling_prefix = spots_file.rpartition("/")[0] + "/" if spots_file else prefix
+            objects = _list_cached(bucket, sibling_prefix)
+
+        # Look for ratios.txt and summary_stats.csv in a single pass; one
+        # C-level suffix test rejects unrelated keys
         for key in objects:
-            filename = Path(key).name
-            if "summary_stats.csv" in filename:
-                logger.info(f"Found summary stats file: {key}")
+            if not key.endswith(_RELATED_SUFFIXES):
+                continue
+            if key.endswith("_ratios.txt"):
+                if result["ratios"] is None:
+                    logger.info("Found ratios file: %s", key)
+                    result["ratios"] = key
+            elif result["summary_stats"] is None:
+                logger.info("Found summary stats file: %s", key)
                 result["summary_stats"] = key
+            if result["ratios"] is not None and result["summary_stats"] is not None:
                 break
 
     except Exception as e:
@@ -584,7 +794,9 @@ def find_related_files(
     return result
 
 
-def load_ratios_from_s3(bucket: str, key: str) -> Optional[np.ndarray]:
+def load_ratios_from_s3(
+    bucket: str, key: str, cache_dir: Optional[str] = None
+) -> Optional[np.ndarray]:
     """
     Load a ratios.txt file from S3.
 
@@ -594,6 +806,11 @@ def load_ratios_from_s3(bucket: str, key: str) -> Optional[np.ndarray]:
         S3 bucket name
     key: str
         S3 key for the ratios file
+    cache_dir: Optional[str]
+        If given, the file is fetched through s3_handler.download_file's
+        local cache (checked against the object's size and LastModified) and
+        the parsed matrix is kept as a binary .npy next to it, reused while
+        it is newer than the downloaded file
 
     Returns:
     --------
@@ -604,7 +821,10 @@ def load_ratios_from_s3(bucket: str, key: str) -> Optional[np.ndarray]:
         logger.warning("No ratios file key provided")
         return None
 
-    logger.info(f"Loading ratios from s3://{bucket}/{key}")
+    if cache_dir is not None:
+        return _load_cached_ratios(bucket, key, cache_dir)
+
+    logger.info("Loading ratios from s3://%s/%s", bucket, key)
 
     try:
         # Download the file content
@@ -613,22 +833,58 @@ def load_ratios_from_s3(bucket: str, key: str) -> Optional[np.ndarray]:
             logger.error(f"Failed to get object content for {key}")
             return None
 
-        # Parse the content as a matrix of numbers
-        content_str = content.decode("utf-8")
-        rows = content_str.strip().split("\n")
-        ratios_matrix = []
+        # Parse the whitespace/tab separated integer matrix in numpy's C parser
+        return np.loadtxt(io.BytesIO(content), dtype=np.int64, ndmin=2)
 
-        for row in rows:
-            # Split by tabs and convert to integers
-            values = [int(val) for val in row.strip().split()]
-            ratios_matrix.append(values)
+    except Exception as e:
+        logger.error(f"Error loading ratios file: {e}", exc_info=True)
+        return None
+
+
+def _load_cached_ratios(
+    bucket: str, key: str, cache_dir: str
+) -> Optional[np.ndarray]:
+    """
+    Load a ratios file via the local download cache, reusing its parsed .npy.
+
+    download_file re-fetches the text file when the S3 object changed, which
+    makes it newer than the .npy, so the matrix is parsed again.
+    """
+    local_path = s3_handler.download_file(
+        key=key, bucket_name=bucket, cache_dir=cache_dir, validate=True
+    )
+    if local_path is None:
+        logger.error(f"Failed to download ratios file {key}")
+        return None
 
-        return np.array(ratios_matrix)
+    npy_path = Path(f"{local_path}.npy")
+    try:
+        if npy_path.stat().st_mtime >= Path(local_path).stat().st_mtime:
+            ratios = np.load(npy_path)
+            logger.info("Loaded cached ratios from %s", npy_path)
+            return ratios
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable ratios cache {npy_path}: {e}")
 
+    try:
+        ratios = np.loadtxt(local_path, dtype=np.int64, ndmin=2)
     except Exception as e:
         logger.error(f"Error loading ratios file: {e}", exc_info=True)
         return None
 
+    tmp_path = npy_path.with_name(f"{npy_path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            np.save(f, ratios)
+        os.replace(tmp_path, npy_path)
+    except OSError as e:
+        logger.warning(f"Could not cache ratios at {npy_path}: {e}")
+        tmp_path.unlink(missing_ok=True)
+
+    return ratios
+
 
 def load_summary_stats_from_s3(
     bucket: str, key: str
@@ -652,33 +908,93 @@ def load_summary_stats_from_s3(
         logger.warning("No summary stats file key provided")
         return None
 
-    logger.info(f"Loading summary stats from s3://{bucket}/{key}")
+    logger.info("Loading summary stats from s3://%s/%s", bucket, key)
 
     try:
-        # Download the file content
-        content = s3_handler.get_object(key=key, bucket_name=bucket)
-        if content is None:
+        # Stream the object body straight into the CSV parser
+        body = s3_handler.get_streaming_body(key=key, bucket_name=bucket)
+        if body is None:
             logger.error(f"Failed to get object content for {key}")
             return None
 
-        # Parse CSV
-        df = pd.read_csv(io.BytesIO(content))
+        # Parse CSV with Arrow's multi-threaded reader
+        try:
+            table = pacsv.read_csv(body)
+        finally:
+            body.close()
 
         # Add 'removed_spots' column
-        if "total_spots" in df.columns and "kept_spots" in df.columns:
-            df["removed_spots"] = df["total_spots"] - df["kept_spots"]
-            df["unchanged_spots"] = df["kept_spots"] - df["reassigned_spots"]
+        if "total_spots" in table.column_names and "kept_spots" in table.column_names:
+            kept = table["kept_spots"]
+            table = table.append_column(
+                "removed_spots", pc.subtract(table["total_spots"], kept)
+            )
+            table = table.append_column(
+                "unchanged_spots", pc.subtract(kept, table["reassigned_spots"])
+            )
 
-        return df
+        # Callers consume records via pandas
+        return table.to_pandas()
 
     except Exception as e:
         logger.error(f"Error loading summary stats file: {e}", exc_info=True)
         return None
 
 
+def load_related_files_from_s3(
+    bucket: str,
+    related_files: Dict[str, Optional[str]],
+    max_workers: int = 4,
+    cache_dir: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Fetch and parse the ratios / summary stats files concurrently.
+
+    Each file is downloaded and parsed in its own worker thread, so parsing
+    one overlaps with the other's download.
+
+    Parameters:
+    -----------
+    bucket: str
+        S3 bucket name
+    related_files: Dict[str, Optional[str]]
+        Output of find_related_files ('ratios' / 'summary_stats' -> key or None)
+    max_workers: int
+        Maximum concurrent fetches
+    cache_dir: Optional[str]
+        Local cache root for the parsed ratios matrix (see load_ratios_from_s3)
+
+    Returns:
+    --------
+    Dict[str, Any]
+        'ratios' -> Optional[np.ndarray], 'summary_stats' -> Optional[pd.DataFrame]
+    """
+    loaders = {
+        "ratios": partial(load_ratios_from_s3, cache_dir=cache_dir),
+        "summary_stats": load_summary_stats_from_s3,
+    }
+    results: Dict[str, Any] = {name: None for name in loaders}
+    jobs = {
+        name: key for name, key in related_files.items()
+        if key and name in loaders
+    }
+    if not jobs:
+        return results
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as executor:
+        futures = {
+            executor.submit(loaders[name], bucket, key): name
+            for name, key in jobs.items()
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    return results
+
+
 def get_s3_object_size(bucket: str, key: str) -> Optional[int]:
     """Gets the size of an S3 object in bytes using the handler."""
-    logger.info(f"Checking size for object: s3://{bucket}/{key}")
+    logger.info("Checking size for object: s3://%s/%s", bucket, key)
     try:
         # Use the get_object_metadata method (assumes it was added to S3Handler)
         # Check if the method exists before calling
@@ -698,7 +1014,7 @@ def get_s3_object_size(bucket: str, key: str) -> Optional[int]:
             size_bytes = metadata["ContentLength"]
             # Convert size to MB for readability
             size_mb = size_bytes / (1024 * 1024)
-            logger.info(f"Object size: {size_bytes} bytes ({size_mb:.2f} MB)")
+            logger.info("Object size: %d bytes (%.2f MB)", size_bytes, size_mb)
             return size_bytes
         else:
             logger.warning(
@@ -712,16 +1028,27 @@ def get_s3_object_size(bucket: str, key: str) -> Optional[int]:
         return None
 
 
+def _write_valid_cache(df: pd.DataFrame, path: Path) -> None:
+    """Persist a filtered DataFrame next to its source pickle (best effort)."""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        df.to_parquet(tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+        _fsync_dir(path.parent)
+        logger.info(f"Cached filtered DataFrame at {path}")
+    except Exception as e:
+        # e.g. object columns Arrow can't represent; just reload next time
+        logger.warning(f"Could not cache filtered DataFrame at {path}: {e}")
+        tmp_path.unlink(missing_ok=True)
+
+
 def load_pkl_from_s3(bucket: str, key: str) -> Optional[pd.DataFrame]:
     """Loads a pickle file from S3 into a pandas DataFrame, using local caching."""
     logger.info(
         f"Attempting to load pickle file: s3://{bucket}/{key} (using cache)"
     )
 
-    # 1. Get object size for context (optional, still useful)
-    get_s3_object_size(bucket, key)
-
-    # 2. Download the file (or get from cache)
+    # 1. Download the file (or get from cache)
     logger.info("Checking cache or downloading file...")
     try:
         # Use the new download_file method
@@ -732,7 +1059,11 @@ def load_pkl_from_s3(bucket: str, key: str) -> Optional[pd.DataFrame]:
             logger.error("Failed to download or retrieve file from cache.")
             return None
 
-        logger.info(f"File available locally at: {local_file_path}")
+        # Size from the local file rather than a separate HEAD request
+        size_mb = Path(local_file_path).stat().st_size / (1024 * 1024)
+        logger.info(
+            f"File available locally at: {local_file_path} ({size_mb:.2f} MB)"
+        )
 
     except Exception as e:
         logger.error(
@@ -740,16 +1071,39 @@ def load_pkl_from_s3(bucket: str, key: str) -> Optional[pd.DataFrame]:
         )
         return None
 
+    # 2. Reuse the filtered copy from a previous load if it is newer than the
+    # pickle it was derived from
+    valid_cache_path = Path(f"{local_file_path}.valid.parquet")
+    try:
+        if (
+            valid_cache_path.stat().st_mtime
+            >= Path(local_file_path).stat().st_mtime
+        ):
+            df = pd.read_parquet(valid_cache_path)
+            logger.info(
+                f"Loaded filtered DataFrame from {valid_cache_path}. Shape: {df.shape}"
+            )
+            return df
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable filtered cache {valid_cache_path}: {e}")
+
     # 3. Load the pickle data using pandas from the local path
     logger.info(f"Loading pickle data from local file: {local_file_path}...")
     df = None
     try:
-        df = pd.read_pickle(local_file_path)
+        df = _read_pickle(local_file_path)
         n_all = df.shape[0]
-        df = df[df["valid_spot"]]
+        # valid_spot is already boolean; use it as a raw mask and skip the
+        # row copy entirely when every spot is valid
+        mask = df["valid_spot"].to_numpy(dtype=bool)
+        if not mask.all():
+            df = df.loc[mask]
         n_valid = df.shape[0]
         logger.info(f"Successfully loaded DataFrame. Shape: {df.shape}")
         logger.info(f"Total spots: {n_all}, Valid spots: {n_valid}")
+        _write_valid_cache(df, valid_cache_path)
         return df
     except pd.errors.EmptyDataError:
         logger.error(
@@ -792,7 +1146,7 @@ def load_processing_manifest_from_s3(
         logger.warning("No processing manifest file key provided")
         return None
 
-    logger.info(f"Loading processing manifest from s3://{bucket}/{key}")
+    logger.info("Loading processing manifest from s3://%s/%s", bucket, key)
 
     try:
         # Download the file content
@@ -801,8 +1155,8 @@ def load_processing_manifest_from_s3(
             logger.error(f"Failed to get object content for {key}")
             return None
 
-        # Parse the JSON content
-        manifest_data = json.loads(content.decode("utf-8"))
+        # Parse the JSON bytes directly (no intermediate str)
+        manifest_data = orjson.loads(content)
         logger.info(
             f"Successfully loaded and parsed processing manifest: {key}"
         )
@@ -60,10 +60,10 @@ def main():
         return
     
     # show value counts for 'chan' and 'unmixed_chan' columns before subsampling
-    print("\n--- Value Counts for 'chan' column before subsampling ---")
-    print(df['chan'].value_counts(dropna=False))cell_body_segmentation
-    print("\n--- Value Counts for 'unmixed_chan' column before subsampling ---")
-    print(df['unmixed_chan'].value_counts(dropna=False))
+    for col in ('chan', 'unmixed_chan'):
+        if col in df.columns:
+            print(f"\n--- Value Counts for '{col}' column before subsampling ---")
+            print(df[col].value_counts(dropna=False))
 
     # 3. Subsample the data
     if len(df) > SAMPLE_SIZE:
@@ -91,10 +91,10 @@ def main():
         print(plot_df['reassigned'].value_counts(dropna=False))
 
     # value counts for 'unmixed_chan' column and 'chan' column
-    print("\n--- Value Counts for 'unmixed_chan' column ---")
-    print(plot_df['unmixed_chan'].value_counts(dropna=False))
-    print("\n--- Value Counts for 'chan' column ---")
-    print(plot_df['chan'].value_counts(dropna=False))
+    for col in ('unmixed_chan', 'chan'):
+        if col in plot_df.columns:
+            print(f"\n--- Value Counts for '{col}' column ---")
+            print(plot_df[col].value_counts(dropna=False))
 
     logger.info("--- Data inspection script finished ---")
 
@@ -1,3 +1,4 @@
+import os
 import sys
 from pathlib import Path
 import unittest
@@ -16,6 +17,10 @@ BUCKET = "aind-open-data"
 SPOTS_PREFIX = f"{DATASET}/image_spot_spectral_unmixing/"
 
 
+@unittest.skipUnless(
+    os.getenv("SEESPOT_INTEGRATION_TESTS"),
+    "set SEESPOT_INTEGRATION_TESTS=1 to run tests against live S3",
+)
 class TestProblemDatasetLoading(unittest.TestCase):
     """Integration-style checks for problematic dataset loading.
 
@@ -27,6 +32,11 @@ class TestProblemDatasetLoading(unittest.TestCase):
     def setUpClass(cls):
         # Ensure cache root exists
         Path("/s3-cache").mkdir(exist_ok=True)
+        cls.parquet_path = Path(f"/s3-cache/{BUCKET}/{DATASET}/{DATASET}.parquet")
+        # Merge (or read from the parquet cache) once for the whole class
+        cls.df = load_and_merge_spots_from_s3(
+            BUCKET, DATASET, SPOTS_PREFIX, valid_spots_only=False
+        )
 
     def test_processing_manifest_exists(self):
         manifest_key = find_processing_manifest(BUCKET, DATASET)
@@ -42,7 +52,7 @@ class TestProblemDatasetLoading(unittest.TestCase):
             )
 
     def test_merge_dataframe_columns(self):
-        df = load_and_merge_spots_from_s3(BUCKET, DATASET, SPOTS_PREFIX, valid_spots_only=False)
+        df = self.df
         self.assertIsNotNone(df, "Merged DataFrame is None")
         cols = set(df.columns)
         # Required columns for spot_details logic
@@ -57,11 +67,13 @@ class TestProblemDatasetLoading(unittest.TestCase):
         )
 
     def test_parquet_cached(self):
-        parquet_path = Path(f"/s3-cache/{BUCKET}/{DATASET}/{DATASET}.parquet")
-        # Trigger merge first to ensure file creation
-        _ = load_and_merge_spots_from_s3(BUCKET, DATASET, SPOTS_PREFIX, valid_spots_only=True)
-        self.assertTrue(parquet_path.exists(), "Merged parquet file not cached")
-        self.assertGreater(parquet_path.stat().st_size, 0, "Parquet file size is zero")
+        # setUpClass already ran the merge that writes the cache file
+        try:
+            size = os.stat(self.parquet_path).st_size
+        except FileNotFoundError:
+            size = None
+        self.assertIsNotNone(size, "Merged parquet file not cached")
+        self.assertGreater(size, 0, "Parquet file size is zero")
 
     def test_s3_paths_accessible(self):
         # Metadata check for a representative object (manifest or unmixed file)
@@ -33,9 +33,13 @@ try:
         # Check if parquet file was created
         import pathlib
         parquet_file = pathlib.Path(f"/s3-cache/{bucket}/{dataset_name}/{dataset_name}.parquet")
-        print(f"✅ Parquet file created: {parquet_file.exists()}")
-        if parquet_file.exists():
-            print(f"✅ Parquet file size: {parquet_file.stat().st_size / (1024*1024):.1f} MB")
+        try:
+            size = os.stat(parquet_file).st_size
+        except FileNotFoundError:
+            size = None
+        print(f"✅ Parquet file created: {size is not None}")
+        if size is not None:
+            print(f"✅ Parquet file size: {size / (1024*1024):.1f} MB")
     else:
         print("❌ Failed to load merged DataFrame")
         
@@ -0,0 +1,112 @@
+"""Offline tests for the Neuroglancer link helpers in see_spot.ng_utils."""
+
+import io
+import json
+import tempfile
+import unittest
+import urllib.parse
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest import mock
+
+from see_spot import ng_utils
+
+
+class WavelengthColourLookupTest(unittest.TestCase):
+    """The precomputed colour table agrees with the band scan."""
+
+    def test_table_matches_scan(self):
+        """Every tabulated wavelength maps to the scanned band colour."""
+        for wavelength in range(len(ng_utils._HEX_LUT)):
+            self.assertEqual(
+                ng_utils.wavelength_to_hex_pure_colours(wavelength),
+                ng_utils._scan_wavelength_color_map(wavelength),
+                wavelength,
+            )
+
+    def test_values_outside_table_fall_back_to_scan(self):
+        """Negative, large and non-integer wavelengths use the scan."""
+        for wavelength in (-1, 1024, 5000, 2.5, 638.0):
+            self.assertEqual(
+                ng_utils.wavelength_to_hex_pure_colours(wavelength),
+                ng_utils._scan_wavelength_color_map(wavelength),
+                wavelength,
+            )
+
+    def test_hex_string_formatting(self):
+        """Colour strings are zero-padded '#rrggbb' for every input."""
+        for wavelength in (0, 1, 3, 5, 638, 2000, 2.5):
+            expected = "#{:06x}".format(
+                ng_utils._scan_wavelength_color_map(wavelength)
+            )
+            self.assertEqual(
+                ng_utils._wavelength_to_hex_str(wavelength), expected
+            )
+
+
+class ResolveOutputDimensionsTest(unittest.TestCase):
+    """Shared resolution/dimension setup of the link builders."""
+
+    def test_given_resolution_is_used(self):
+        """An explicit z,y,x resolution sets the voxel sizes."""
+        dims = ng_utils._resolve_output_dimensions(
+            ["s3://bucket/fused/channel_488.zarr"], [2.0, 0.5, 0.25]
+        )
+        self.assertEqual(dims["z"]["voxel_size"], 2.0)
+        self.assertEqual(dims["y"]["voxel_size"], 0.5)
+        self.assertEqual(dims["x"]["voxel_size"], 0.25)
+
+    def test_result_is_a_private_copy(self):
+        """Mutating one link's dimensions does not leak into the next."""
+        paths = ["s3://bucket/fused/channel_488.zarr"]
+        first = ng_utils._resolve_output_dimensions(paths, [1.0, 1.0, 1.0])
+        first["t"]["voxel_size"] = 99
+        second = ng_utils._resolve_output_dimensions(paths, [1.0, 1.0, 1.0])
+        self.assertNotEqual(second["t"]["voxel_size"], 99)
+
+    def test_unreadable_zarr_falls_back_to_unit_resolution(self):
+        """A failed zarr read gives 1.0 voxels on every spatial axis."""
+        with mock.patch.object(
+            ng_utils, "_resolution_and_dims", side_effect=LookupError("x")
+        ), redirect_stdout(io.StringIO()):
+            dims = ng_utils._resolve_output_dimensions(["s3://b/c.zarr"])
+        for axis in ("z", "y", "x"):
+            self.assertEqual(dims[axis]["voxel_size"], 1.0)
+
+
+class LinkFromJsonTest(unittest.TestCase):
+    """create_link_from_json on a local Neuroglancer state file."""
+
+    def test_spot_layer_replaces_old_annotations(self):
+        """Old annotation layers are hidden and the spot layer appended."""
+        state = {
+            "position": [0, 0, 0, 0],
+            "layers": [
+                {"type": "image", "name": "488"},
+                {"type": "annotation", "name": "cells"},
+                {"type": "annotation", "name": "Spot 5", "tab": "annotations"},
+            ],
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp, "state.json")
+            path.write_text(json.dumps(state))
+            with redirect_stdout(io.StringIO()):
+                url = ng_utils.create_link_from_json(
+                    str(path), [1, 2, 3, 0], 5, [1, 2, 3, 0]
+                )
+
+        rendered = json.loads(urllib.parse.unquote(url.split("#!", 1)[1]))
+        self.assertEqual(rendered["position"], [1, 2, 3, 0])
+        names = [layer["name"] for layer in rendered["layers"]]
+        self.assertEqual(names, ["488", "cells", "Spot 5"])
+        self.assertFalse(rendered["layers"][1]["visible"])
+        spot_layer = rendered["layers"][2]
+        self.assertTrue(spot_layer["visible"])
+        self.assertEqual(
+            spot_layer["annotations"],
+            [{"type": "point", "id": "5", "point": [1, 2, 3, 0]}],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,266 @@
+"""Offline tests for the S3Handler listing and caching helpers."""
+
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest import mock
+
+from botocore.exceptions import ClientError
+
+from see_spot import s3_handler as s3_handler_module
+from see_spot.s3_handler import S3Handler
+
+
+class _FakePaginator:
+    """Minimal list_objects_v2 paginator over an in-memory key list."""
+
+    def __init__(self, client):
+        """Keep a reference to the owning fake client."""
+        self.client = client
+
+    def paginate(
+        self, Bucket, Prefix="", Delimiter=None, PaginationConfig=None
+    ):
+        """Yield list_objects_v2-style pages, 1000 entries per page."""
+        self.client.list_calls += 1
+        config = PaginationConfig or {}
+        max_items = config.get("MaxItems")
+        page_size = config.get("PageSize", 1000)
+
+        contents = []
+        common = []
+        for key in sorted(self.client.keys):
+            if not key.startswith(Prefix):
+                continue
+            rest = key[len(Prefix):]
+            if Delimiter and Delimiter in rest:
+                sub_prefix = Prefix + rest.split(Delimiter)[0] + Delimiter
+                if sub_prefix not in common:
+                    common.append(sub_prefix)
+            else:
+                contents.append(key)
+        if max_items is not None:
+            contents = contents[:max_items]
+
+        for start in range(0, max(len(contents), 1), page_size):
+            yield {
+                "Contents": [
+                    {"Key": key} for key in contents[start:start + page_size]
+                ],
+                "CommonPrefixes": (
+                    [{"Prefix": p} for p in common] if start == 0 else []
+                ),
+            }
+
+
+class _FakeS3Client:
+    """Stand-in for the boto3 S3 client used by S3Handler."""
+
+    def __init__(self, keys):
+        """Serve listings of ``keys`` and count LIST calls."""
+        self.keys = list(keys)
+        self.list_calls = 0
+        self.transfer_configs = []
+        self._lock = threading.Lock()
+
+    def get_paginator(self, name):
+        """Return a paginator over the fake key list."""
+        return _FakePaginator(self)
+
+    def download_file(self, Bucket, Key, Filename, Config=None):
+        """Record the transfer settings and write an empty file."""
+        with self._lock:
+            self.transfer_configs.append(Config)
+        Path(Filename).write_bytes(b"")
+
+
+def _make_handler(keys):
+    """Build an S3Handler backed by a fake client, without touching boto3."""
+    with mock.patch.object(S3Handler, "init_s3_client"):
+        handler = S3Handler(bucket_name="bucket")
+    handler.s3_client = _FakeS3Client(keys)
+    return handler
+
+
+class KeyCacheTest(unittest.TestCase):
+    """Tests for preload_keys / key_exists caching."""
+
+    def test_listing_is_reused_within_ttl(self):
+        """A second lookup within the TTL does not re-list the prefix."""
+        handler = _make_handler(["ds/derived/other.json"])
+        self.assertFalse(
+            handler.key_exists("ds/derived/processing_manifest.json")
+        )
+        self.assertFalse(
+            handler.key_exists("ds/derived/processing_manifest.json")
+        )
+        self.assertEqual(handler.s3_client.list_calls, 1)
+
+    def test_object_written_later_is_found_after_ttl(self):
+        """Cached listings expire, so later writes become visible."""
+        handler = _make_handler(["ds/derived/other.json"])
+        key = "ds/derived/processing_manifest.json"
+        with mock.patch.object(
+            s3_handler_module.time, "monotonic", return_value=1000.0
+        ):
+            self.assertFalse(handler.key_exists(key))
+
+        handler.s3_client.keys.append(key)
+        expired = 1000.0 + s3_handler_module._KEY_CACHE_TTL_S + 1
+        with mock.patch.object(
+            s3_handler_module.time, "monotonic", return_value=expired
+        ):
+            self.assertTrue(handler.key_exists(key))
+        self.assertEqual(handler.s3_client.list_calls, 2)
+
+    def test_cache_is_bounded(self):
+        """The oldest prefix is evicted once the cache is full."""
+        limit = 3
+        keys = [f"ds/p{i}/k" for i in range(limit + 1)]
+        handler = _make_handler(keys)
+        with mock.patch.object(
+            s3_handler_module, "_KEY_CACHE_MAX_PREFIXES", limit
+        ):
+            for i in range(limit + 1):
+                handler.preload_keys(f"ds/p{i}/", delimiter="/")
+        self.assertEqual(len(handler._key_cache), limit)
+        self.assertNotIn(("bucket", "ds/p0/", "/"), handler._key_cache)
+
+
+class DownloadFanOutTest(unittest.TestCase):
+    """Tests for concurrent downloads sharing one connection pool."""
+
+    def _download_files(self, n_keys, max_workers):
+        """Download n_keys fake objects and return the transfer configs."""
+        keys = [f"ds/file{i:03d}" for i in range(n_keys)]
+        handler = _make_handler(keys)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            results = handler.download_files(
+                keys, cache_dir=cache_dir, max_workers=max_workers
+            )
+        self.assertEqual(len(results), n_keys)
+        self.assertTrue(all(path is not None for path in results.values()))
+        return handler.s3_client.transfer_configs
+
+    def test_threads_fit_in_connection_pool(self):
+        """Workers x ranged-GET threads stays within max_pool_connections."""
+        pool = s3_handler_module._MAX_POOL_CONNECTIONS
+        for max_workers in (8, 16, 64, 200):
+            configs = self._download_files(100, max_workers)
+            workers = min(max_workers, pool)
+            for config in configs:
+                self.assertLessEqual(workers * config.max_concurrency, pool)
+
+    def test_single_download_keeps_full_concurrency(self):
+        """A lone file still uses the module's full transfer settings."""
+        configs = self._download_files(1, 64)
+        self.assertEqual(configs, [s3_handler_module._TRANSFER_CONFIG])
+
+
+class CacheFreshnessTest(unittest.TestCase):
+    """Tests for the HEAD-based cache validation in _cache_is_fresh."""
+
+    def setUp(self):
+        """A 5-byte cached file stamped at a fixed mtime."""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.local = Path(tmp.name, "spots.pkl")
+        self.local.write_bytes(b"spots")
+        self.mtime = 1_700_000_000
+        os.utime(self.local, (self.mtime, self.mtime))
+        self.handler = _make_handler([])
+
+    def _is_fresh(self, metadata):
+        """Run _cache_is_fresh against a stubbed HEAD response."""
+        with mock.patch.object(
+            self.handler, "get_object_metadata", return_value=metadata
+        ):
+            return self.handler._cache_is_fresh(
+                self.local, "ds/spots.pkl", "bucket"
+            )
+
+    def _modified(self, offset):
+        """LastModified offset seconds from the cached file's mtime."""
+        return datetime.fromtimestamp(self.mtime + offset, tz=timezone.utc)
+
+    def test_unchanged_object_is_fresh(self):
+        """Same size and not modified since the download: keep it."""
+        self.assertTrue(
+            self._is_fresh(
+                {"ContentLength": 5, "LastModified": self._modified(-60)}
+            )
+        )
+
+    def test_size_mismatch_is_stale(self):
+        """A different object size forces a re-download."""
+        self.assertFalse(
+            self._is_fresh(
+                {"ContentLength": 6, "LastModified": self._modified(-60)}
+            )
+        )
+
+    def test_newer_object_is_stale(self):
+        """An object overwritten after the download is re-fetched."""
+        self.assertFalse(
+            self._is_fresh(
+                {"ContentLength": 5, "LastModified": self._modified(60)}
+            )
+        )
+
+    def test_failed_head_keeps_cached_copy(self):
+        """If the object can't be inspected the cached copy is used."""
+        self.assertTrue(self._is_fresh(None))
+
+
+class ThrottleLoggingTest(unittest.TestCase):
+    """A throttled request is reported by a single error log."""
+
+    def test_throttled_get_logs_once(self):
+        """The throttle detail is folded into the one error record."""
+        handler = _make_handler([])
+        handler.s3_client.get_object = mock.Mock(
+            side_effect=ClientError(
+                {
+                    "Error": {"Code": "SlowDown", "Message": "Reduce rate"},
+                    "ResponseMetadata": {"RetryAttempts": 9},
+                },
+                "GetObject",
+            )
+        )
+        with self.assertLogs(s3_handler_module.logger, "WARNING") as logs:
+            self.assertIsNone(handler.get_object("ds/key"))
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(logs.records[0].levelname, "ERROR")
+        self.assertIn("throttled: SlowDown after 9 retries", logs.output[0])
+
+
+class EnvIntTest(unittest.TestCase):
+    """Tests for the SEESPOT_S3_* environment overrides."""
+
+    def test_valid_value_is_used(self):
+        """A positive integer overrides the default."""
+        with mock.patch.dict("os.environ", {"SEESPOT_TEST_INT": "8"}):
+            self.assertEqual(
+                s3_handler_module._env_int("SEESPOT_TEST_INT", 16), 8
+            )
+
+    def test_missing_or_invalid_value_falls_back(self):
+        """Unset, malformed and non-positive values give the default."""
+        with mock.patch.dict("os.environ", {}, clear=True):
+            self.assertEqual(
+                s3_handler_module._env_int("SEESPOT_TEST_INT", 16), 16
+            )
+        for raw in ("16MB", "", "0", "-4"):
+            with mock.patch.dict("os.environ", {"SEESPOT_TEST_INT": raw}):
+                with self.assertLogs(s3_handler_module.logger, "WARNING"):
+                    self.assertEqual(
+                        s3_handler_module._env_int("SEESPOT_TEST_INT", 16),
+                        16,
+                    )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,460 @@
+"""Offline tests for the spots loading helpers in see_spot.s3_utils."""
+
+import io
+import json
+import os
+import pickle
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+from see_spot import s3_utils
+
+
+def _pickled(df):
+    """Return ``df`` pickled into an in-memory buffer, as S3 would serve it."""
+    return io.BytesIO(pickle.dumps(df))
+
+
+class OptimizeDtypesTest(unittest.TestCase):
+    """Tests for _schema_cast_plan and optimize_dtypes."""
+
+    def setUp(self):
+        """A spots table as it comes out of the pickles."""
+        self.df = pl.DataFrame(
+            {
+                "chan": ["488", "561"],
+                "unmixed_chan": ["488", "488"],
+                "cell_id": [7, 8],
+                "round": [1, 2],
+                "spot_id": [1, 2],
+                "chan_spot_id": [1, 1],
+                "valid_spot": [1, 0],
+                "x": [1.5, 2.5],
+                "big": [1.0, 1e300],
+            }
+        )
+
+    def test_known_columns_are_narrowed(self):
+        """Labels, ids, flags and in-range floats get compact dtypes."""
+        schema = s3_utils.optimize_dtypes(self.df).schema
+        self.assertEqual(schema["chan"], pl.Categorical)
+        self.assertEqual(schema["unmixed_chan"], pl.Categorical)
+        self.assertEqual(schema["cell_id"], pl.Utf8)
+        self.assertEqual(schema["round"], pl.Int8)
+        self.assertEqual(schema["spot_id"], pl.Int32)
+        self.assertEqual(schema["chan_spot_id"], pl.Int32)
+        self.assertEqual(schema["valid_spot"], pl.Boolean)
+        self.assertEqual(schema["x"], pl.Float32)
+        # Outside the Float32 range: left at Float64
+        self.assertEqual(schema["big"], pl.Float64)
+
+    def test_floats_kept_without_downcast(self):
+        """downcast_floats=False leaves every float column alone."""
+        schema = s3_utils.optimize_dtypes(
+            self.df, downcast_floats=False
+        ).schema
+        self.assertEqual(schema["x"], pl.Float64)
+
+    def test_already_narrow_columns_are_not_recast(self):
+        """A frame that was optimized once yields an empty cast plan."""
+        optimized = s3_utils.optimize_dtypes(self.df)
+        cast_items, float64_cols = s3_utils._schema_cast_plan(
+            tuple(optimized.schema.items()), True
+        )
+        self.assertEqual(cast_items, ())
+        self.assertEqual(float64_cols, ("big",))
+
+    def test_keep_cols_are_untouched(self):
+        """Columns listed in keep_cols keep their original dtype."""
+        schema = s3_utils.optimize_dtypes(
+            self.df, keep_cols=("chan", "chan_spot_id")
+        ).schema
+        self.assertEqual(schema["chan"], pl.Utf8)
+        self.assertEqual(schema["chan_spot_id"], pl.Int64)
+        self.assertEqual(schema["spot_id"], pl.Int32)
+
+
+class SpotsToPandasTest(unittest.TestCase):
+    """Records built from optimized tables stay JSON-serializable."""
+
+    def test_removed_spots_give_none_not_nan(self):
+        """Null unmixed_chan comes out as None, encodable without NaN."""
+        df = s3_utils.optimize_dtypes(
+            pl.DataFrame(
+                {
+                    "spot_id": [1, 2],
+                    "chan": ["488", "561"],
+                    "unmixed_chan": ["488", None],
+                }
+            )
+        )
+        self.assertEqual(df.schema["unmixed_chan"], pl.Categorical)
+
+        records = s3_utils.spots_to_pandas(df).to_dict(orient="records")
+        self.assertEqual(
+            records,
+            [
+                {"spot_id": 1, "chan": "488", "unmixed_chan": "488"},
+                {"spot_id": 2, "chan": "561", "unmixed_chan": None},
+            ],
+        )
+        json.dumps(records, allow_nan=False)
+
+
+class MergeNarrowedTablesTest(unittest.TestCase):
+    """Merging tables that were narrowed by _fetch_spots."""
+
+    def setUp(self):
+        """Build mixed/unmixed tables with differently sized integer ranges."""
+        self.mixed = pd.DataFrame(
+            {
+                "chan": ["488", "488", "561", "638"],
+                "chan_spot_id": [1, 2, 1, 3],
+                "round": [1, 1, 2, 2],
+                "x": [1.0, 2.0, 3.0, 4.0],
+                "valid_spot": [True, True, False, True],
+            }
+        )
+        # Different row order and a wider id range than the mixed table
+        self.unmixed = pd.DataFrame(
+            {
+                "chan": ["638", "561", "488", "488"],
+                "chan_spot_id": [3, 1, 2, 2**40],
+                "unmixed_chan": ["561", "561", "488", "488"],
+                "r": [0.9, 0.8, 0.7, 0.6],
+            }
+        )
+
+    def _fetch(self, df):
+        """Run a table through _fetch_spots with a stubbed download."""
+        with mock.patch.object(
+            s3_utils.s3_handler,
+            "download_to_buffer",
+            return_value=_pickled(df),
+        ):
+            return s3_utils._fetch_spots("bucket", "key.pkl")
+
+    def test_join_keys_keep_raw_dtypes_before_merge(self):
+        """_fetch_spots does not narrow the join keys."""
+        mixed = self._fetch(self.mixed)
+        unmixed = self._fetch(self.unmixed)
+        for col in s3_utils._MERGE_KEYS:
+            self.assertEqual(mixed.schema[col], unmixed.schema[col])
+        self.assertEqual(mixed.schema["chan"], pl.Utf8)
+        self.assertEqual(mixed.schema["x"], pl.Float32)
+
+    def test_merge_of_narrowed_tables(self):
+        """Rows are matched on (chan, chan_spot_id) after narrowing."""
+        merged = s3_utils.merge_spots_tables(
+            self._fetch(self.mixed), self._fetch(self.unmixed)
+        ).sort("x")
+        self.assertEqual(
+            merged["unmixed_chan"].cast(pl.Utf8).to_list(),
+            [None, "488", "561", "561"],
+        )
+        self.assertEqual(
+            merged["unmixed_removed"].to_list(), [True, False, False, False]
+        )
+        self.assertEqual(merged.schema["chan"], pl.Categorical)
+        self.assertEqual(merged.schema["chan_spot_id"], pl.Int32)
+
+
+class MergedCacheOrderTest(unittest.TestCase):
+    """Row order of merged spots, fresh and from the parquet cache."""
+
+    def setUp(self):
+        """Stub the S3 lookups and downloads behind load_and_merge."""
+        self.mixed = pl.DataFrame(
+            {
+                "chan": ["638", "488", "561", "488", "638", "561"],
+                "chan_spot_id": [1, 1, 1, 2, 2, 2],
+                "round": [2, 1, 1, 2, 1, 2],
+                "valid_spot": [False, True, True, False, True, True],
+            }
+        )
+        self.unmixed = self.mixed.select(
+            "chan", "chan_spot_id", unmixed_chan=pl.col("chan")
+        )
+        fetched = {"unmixed.pkl": self.unmixed, "mixed.pkl": self.mixed}
+        patches = [
+            mock.patch.object(
+                s3_utils,
+                "find_unmixed_spots_file",
+                return_value="unmixed.pkl",
+            ),
+            mock.patch.object(
+                s3_utils, "find_mixed_spots_file", return_value="mixed.pkl"
+            ),
+            mock.patch.object(
+                s3_utils,
+                "_fetch_spots",
+                side_effect=lambda bucket, key: fetched[key],
+            ),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache_dir = tmp.name
+
+    def _load(self, valid_spots_only):
+        """Run load_and_merge_spots_from_s3 against the temp cache."""
+        return s3_utils.load_and_merge_spots_from_s3(
+            "bucket",
+            "dataset",
+            "prefix/",
+            valid_spots_only=valid_spots_only,
+            cache_dir=self.cache_dir,
+        )
+
+    def test_cached_rows_come_back_in_spot_id_order(self):
+        """A cache hit returns the same rows, in the same order, as a miss."""
+        fresh = self._load(valid_spots_only=False)
+        self.assertEqual(fresh["spot_id"].to_list(), [1, 2, 3, 4, 5, 6])
+
+        parquet = Path(self.cache_dir, "bucket", "dataset", "dataset.parquet")
+        on_disk = pl.read_parquet(parquet)
+        # The file itself is clustered valid-first for row-group skipping
+        self.assertEqual(
+            on_disk["valid_spot"].to_list(),
+            [True, True, True, True, False, False],
+        )
+
+        cached = self._load(valid_spots_only=False)
+        self.assertEqual(cached["spot_id"].to_list(), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(
+            cached["chan"].cast(pl.Utf8).to_list(),
+            fresh["chan"].cast(pl.Utf8).to_list(),
+        )
+
+        valid = self._load(valid_spots_only=True)
+        self.assertEqual(valid["spot_id"].to_list(), [2, 3, 5, 6])
+
+
+class ListCachedTest(unittest.TestCase):
+    """Folder listings come from the handler's TTL key cache."""
+
+    def setUp(self):
+        """Serve one unsorted folder page from a stubbed S3 client."""
+        s3_utils._clear_lookup_cache()
+        self.addCleanup(s3_utils._clear_lookup_cache)
+        self.paginator = mock.Mock()
+        self.paginator.paginate.return_value = [
+            {"Contents": [{"Key": "ds/b.pkl"}, {"Key": "ds/a.pkl"}]}
+        ]
+        client = mock.Mock()
+        client.get_paginator.return_value = self.paginator
+        patch = mock.patch.object(s3_utils.s3_handler, "s3_client", client)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_listing_is_sorted_and_shared(self):
+        """Repeated lookups of a folder issue a single LIST."""
+        for _ in range(2):
+            self.assertEqual(
+                s3_utils._list_cached("bucket", "ds/"),
+                ["ds/a.pkl", "ds/b.pkl"],
+            )
+        self.assertEqual(self.paginator.paginate.call_count, 1)
+        self.assertIn(("bucket", "ds/", "/"), s3_utils.s3_handler._key_cache)
+
+
+class ManifestLookupTest(unittest.TestCase):
+    """Manifest resolution is remembered until _clear_lookup_cache."""
+
+    def setUp(self):
+        """Start from empty lookup caches and a stubbed S3 client."""
+        s3_utils._clear_lookup_cache()
+        self.addCleanup(s3_utils._clear_lookup_cache)
+        self.key = "ds/derived/processing_manifest.json"
+        self.paginator = mock.Mock()
+        self.paginator.paginate.return_value = [
+            {"Contents": [{"Key": self.key}]}
+        ]
+        client = mock.Mock()
+        client.get_paginator.return_value = self.paginator
+        patches = [
+            mock.patch.object(s3_utils.s3_handler, "s3_client", client),
+            mock.patch.object(
+                s3_utils.s3_handler,
+                "list_objects_delim",
+                return_value=([], ["ds/derived/"]),
+            ),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_clear_forgets_manifest_key_and_listing(self):
+        """After clearing, the derived/ folder is listed again."""
+        for _ in range(2):
+            self.assertEqual(
+                s3_utils.find_processing_manifest("bucket", "ds"), self.key
+            )
+        self.assertEqual(self.paginator.paginate.call_count, 1)
+
+        s3_utils._clear_lookup_cache()
+        self.assertEqual(
+            s3_utils.find_processing_manifest("bucket", "ds"), self.key
+        )
+        self.assertEqual(self.paginator.paginate.call_count, 2)
+
+
+class TopLevelFileLookupTest(unittest.TestCase):
+    """Glob matching of spots files against a cached folder listing."""
+
+    def setUp(self):
+        """Serve a fixed folder listing in place of S3."""
+        s3_utils._clear_lookup_cache()
+        self.addCleanup(s3_utils._clear_lookup_cache)
+        self.objects = [
+            "ds/mixed_spots_R3.pkl",
+            "ds/unmixed_spots_R3_minDist_3.pkl",
+            "ds/unmixed_spots_R4_minDist_3.pkl",
+            "ds/unmixed_spots_R5.txt",
+        ]
+        patch = mock.patch.object(
+            s3_utils, "_list_cached", return_value=self.objects
+        )
+        self.list_cached = patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_literal_prefix(self):
+        """The literal head stops at the first glob wildcard."""
+        cases = {
+            "unmixed_spots_*.pkl": "unmixed_spots_",
+            "mixed_spots_R?.pkl": "mixed_spots_R",
+            "[mu]*.pkl": "",
+            "mixed_spots_R3.pkl": "mixed_spots_R3.pkl",
+        }
+        for pattern, expected in cases.items():
+            self.assertEqual(
+                s3_utils._glob_literal_prefix(pattern), expected, pattern
+            )
+
+    def test_first_match_is_returned(self):
+        """The first key whose filename matches the glob is returned."""
+        key = s3_utils._find_top_level_file(
+            "bucket", "ds/", "unmixed_spots_*.pkl", "file"
+        )
+        self.assertEqual(key, "ds/unmixed_spots_R3_minDist_3.pkl")
+        self.list_cached.assert_called_once_with("bucket", "ds/")
+
+    def test_prefix_does_not_match_inside_name(self):
+        """'mixed_spots_*' does not match the unmixed files."""
+        key = s3_utils._find_top_level_file(
+            "bucket", "ds/", "mixed_spots_*.pkl", "mixed spots file"
+        )
+        self.assertEqual(key, "ds/mixed_spots_R3.pkl")
+
+    def test_no_match_returns_none(self):
+        """None is returned when no filename matches."""
+        key = s3_utils._find_top_level_file(
+            "bucket", "ds/", "unmixed_spots_*.csv", "file"
+        )
+        self.assertIsNone(key)
+
+
+class FindRelatedFilesTest(unittest.TestCase):
+    """Suffix matching of the ratios and summary-stats siblings."""
+
+    def setUp(self):
+        """Start each lookup from empty listing caches."""
+        s3_utils._clear_lookup_cache()
+        self.addCleanup(s3_utils._clear_lookup_cache)
+
+    def test_first_match_of_each_suffix_wins(self):
+        """Each kind takes the first listed key with its suffix."""
+        objects = [
+            "ds/unmixed_spots_R3.pkl",
+            "ds/ratios.txt.bak",
+            "ds/R3_summary_stats.csv",
+            "ds/R3_ratios.txt",
+            "ds/R4_ratios.txt",
+            "ds/R4_summary_stats.csv",
+        ]
+        result = s3_utils.find_related_files(
+            "bucket", "ds/", "ds/unmixed_spots_R3.pkl", objects=objects
+        )
+        self.assertEqual(
+            result,
+            {
+                "ratios": "ds/R3_ratios.txt",
+                "summary_stats": "ds/R3_summary_stats.csv",
+            },
+        )
+
+    def test_unrelated_keys_are_ignored(self):
+        """Keys without a related-file suffix are not returned."""
+        objects = ["ds/ratios.csv", "ds/summary_stats.txt", "ds/spots.pkl"]
+        result = s3_utils.find_related_files(
+            "bucket", "ds/", "ds/spots.pkl", objects=objects
+        )
+        self.assertEqual(result, {"ratios": None, "summary_stats": None})
+
+    def test_lists_sibling_folder_when_not_given(self):
+        """Without objects, the spots file's folder is listed."""
+        with mock.patch.object(
+            s3_utils, "_list_cached", return_value=["ds/t0/x_ratios.txt"]
+        ) as list_cached:
+            result = s3_utils.find_related_files(
+                "bucket", "ds/", "ds/t0/unmixed_spots_R3.pkl"
+            )
+        list_cached.assert_called_once_with("bucket", "ds/t0/")
+        self.assertEqual(result["ratios"], "ds/t0/x_ratios.txt")
+
+
+class RatiosCacheTest(unittest.TestCase):
+    """The parsed ratios .npy follows the downloaded ratios file."""
+
+    def setUp(self):
+        """Stub download_file with a local copy that tests can rewrite."""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.local = Path(tmp.name, "bucket", "ds", "ratios.txt")
+        self.local.parent.mkdir(parents=True)
+        patch = mock.patch.object(
+            s3_utils.s3_handler, "download_file", return_value=self.local
+        )
+        self.download = patch.start()
+        self.addCleanup(patch.stop)
+        self.cache_dir = tmp.name
+
+    def _write_source(self, text, mtime):
+        """(Re)write the 'downloaded' ratios file with a given mtime."""
+        self.local.write_text(text)
+        os.utime(self.local, (mtime, mtime))
+
+    def _load(self):
+        """Load the ratios through the cache."""
+        return s3_utils.load_ratios_from_s3(
+            "bucket", "ds/ratios.txt", cache_dir=self.cache_dir
+        )
+
+    def test_npy_reused_until_source_changes(self):
+        """A re-downloaded (newer) source file invalidates the .npy."""
+        self._write_source("1\t2\n3\t4\n", mtime=1_000_000)
+        np.testing.assert_array_equal(self._load(), [[1, 2], [3, 4]])
+        self.assertTrue(Path(f"{self.local}.npy").exists())
+        self.assertTrue(self.download.call_args.kwargs["validate"])
+
+        with mock.patch.object(
+            s3_utils.np, "loadtxt", side_effect=AssertionError("re-parsed")
+        ):
+            np.testing.assert_array_equal(self._load(), [[1, 2], [3, 4]])
+
+        # download_file fetched a rewritten object: newer than the .npy
+        npy_mtime = os.path.getmtime(f"{self.local}.npy")
+        self._write_source("5\t6\n7\t8\n", mtime=npy_mtime + 10)
+        np.testing.assert_array_equal(self._load(), [[5, 6], [7, 8]])
+
+
+if __name__ == "__main__":
+    unittest.main()